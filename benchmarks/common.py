@@ -0,0 +1,43 @@
+"""Shared setup of the benchmark scripts
+
+Each script is run from the repository root, e.g.
+``python benchmarks/serializers.py``. It creates a fresh SQLite
+database in a temporary directory, so it doesn't touch the bot's data.
+"""
+
+import os
+import sys
+import tempfile
+
+
+def setup(**env):
+    """Sets up Django and hero's cache and creates the tables.
+
+    :param env: Environment variables to set first, e.g. ``USE_SQLITE_TUNING='1'``.
+    """
+    # the database is created in the working directory
+    os.chdir(tempfile.mkdtemp(prefix='hero-benchmark-'))
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.environ.update(env)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hero.django_settings')
+    os.environ.setdefault('CACHE_TYPE', 'simple')
+    os.environ.setdefault('NAMESPACE', 'default')
+    # slow operation reports would flood the output
+    os.environ.setdefault('DB_SLOW_THRESHOLD', '0')
+
+    import django
+    from django.conf import settings
+    from django.core import management
+
+    import hero
+
+    hero.cache.init()
+    django.setup(set_prefix=False)
+    # the tables are created from the models since hero doesn't ship migrations
+    settings.MIGRATION_MODULES = {'hero': None}
+    management.call_command('migrate', run_syncdb=True, interactive=False, verbosity=0)
+
+
+def teardown():
+    from hero.executor import shutdown_executor
+    shutdown_executor()
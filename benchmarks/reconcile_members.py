@@ -0,0 +1,62 @@
+"""Measures the reconciliation of the members of a large guild
+
+Prints the time of the initial insert, of a diff that removes half of
+the members and of a pass with nothing to do, with the peak memory
+traced during the diff, and how long a write issued during the
+initial insert has to wait. Uses NumPy if it is installed.
+
+Usage: ``python benchmarks/reconcile_members.py [members]``
+"""
+
+import asyncio
+import sys
+import time
+import tracemalloc
+import types
+
+import common
+
+
+def fake_guild(member_ids):
+    return types.SimpleNamespace(id=1, unavailable=False, chunked=True, text_channels=[], voice_channels=[],
+                                 categories=[], roles=[], members=[types.SimpleNamespace(id=i) for i in member_ids])
+
+
+async def timed(coro):
+    start = time.perf_counter()
+    result = await coro
+    return result, time.perf_counter() - start
+
+
+async def main(count):
+    from hero import async_using_db, models, reconcile
+    from hero.registration import user_registry
+
+    print("numpy: {}".format(reconcile.numpy is not None))
+    # every tenth user is inactive and must not be inserted
+    await async_using_db(models.User.objects.bulk_create)(
+        [models.User(id=i, is_active=i % 10 != 0) for i in range(1, count + 1)], batch_size=5000)
+    await async_using_db(user_registry.load)()
+    reconciler = reconcile.Reconciler()
+
+    initial = asyncio.ensure_future(timed(reconciler.reconcile(fake_guild(range(1, count + 1)), members=True)))
+    await asyncio.sleep(1)
+    _, latency = await timed(models.Guild.async_create(id=2))
+    _, elapsed = await initial
+    print("initial insert: {:.2f} s, a write issued after 1 s waited {:.2f} s".format(elapsed, latency))
+
+    guild = fake_guild(range(count // 2, count + 1))
+    tracemalloc.start()
+    _, elapsed = await timed(reconciler.reconcile(guild, members=True))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print("diff removing half: {:.2f} s, peak traced memory {:.1f} MiB".format(elapsed, peak / 2 ** 20))
+
+    _, elapsed = await timed(reconciler.reconcile(guild, members=True))
+    print("no-op pass: {:.2f} s".format(elapsed))
+
+
+if __name__ == '__main__':
+    common.setup(USE_SQLITE_TUNING='1')
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 250000))
+    common.teardown()
@@ -0,0 +1,52 @@
+"""Compares the size and speed of the cache serializers
+
+msgpack is skipped if it isn't installed.
+
+Usage: ``python benchmarks/serializers.py``
+"""
+
+import time
+
+import common
+
+
+def measure(serializer, value, count):
+    data = serializer.dumps(value)
+    start = time.perf_counter()
+    for _ in range(count):
+        serializer.dumps(value)
+    encode = count / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(count):
+        serializer.loads(data)
+    decode = count / (time.perf_counter() - start)
+    return len(data), encode, decode
+
+
+def main():
+    from aiocache.serializers import JsonSerializer as AiocacheJsonSerializer
+
+    from hero import models, serializers
+
+    candidates = {'json': serializers.JsonSerializer(),
+                  'pickle': serializers.RestrictedPickleSerializer()}
+    if serializers.msgpack is not None:
+        candidates['msgpack'] = serializers.MsgPackSerializer()
+
+    plain = {'id': 123456789012345678, 'names': ['a' * 10] * 20, 'flags': [True, False] * 10, 'score': 1.5}
+    models.Guild.objects.create(id=1)
+    guilds = list(models.Guild.objects.all()) * 50
+
+    for label, value, count, tested in (
+            ("dict of 20 strings, 20 bools, an int and a float", plain, 20000,
+             dict(aiocache_json=AiocacheJsonSerializer(), **candidates)),
+            ("list of 50 Guild instances", guilds, 500, candidates)):
+        print(label)
+        for name, serializer in tested.items():
+            print("  {:14} {:6d} B  enc {:9.0f}/s  dec {:9.0f}/s".format(name, *measure(serializer, value, count)))
+
+
+if __name__ == '__main__':
+    common.setup()
+    main()
+    common.teardown()
@@ -0,0 +1,39 @@
+"""Compares concurrent inserts with and without ``USE_SQLITE_TUNING``
+
+Usage: ``python benchmarks/sqlite_tuning.py [count]``
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import common
+
+
+def run(count):
+    common.setup()
+    from hero import models
+
+    async def main():
+        start = time.perf_counter()
+        await asyncio.gather(*(models.Guild.objects.async_create(id=i) for i in range(1, count + 1)))
+        return time.perf_counter() - start
+
+    elapsed = asyncio.run(main())
+    common.teardown()
+    mode = 'tuned' if os.getenv('USE_SQLITE_TUNING') else 'default'
+    print("{:8} {} concurrent Guild inserts: {:.2f} s".format(mode, count, elapsed))
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    if os.getenv('HERO_BENCHMARK_CHILD'):
+        run(count)
+    else:
+        # the settings are applied when a connection is opened,
+        # so each mode runs in a fresh process
+        for tuning in ('', '1'):
+            env = dict(os.environ, HERO_BENCHMARK_CHILD='1', USE_SQLITE_TUNING=tuning)
+            subprocess.run([sys.executable, __file__, str(count)], env=env, check=True)
@@ -0,0 +1,41 @@
+"""Counts the queries needed to wrap a registered user
+
+The first wrap looks the user up with a single query; wraps within
+``REGISTRATION_CACHE_TTL`` seconds are answered from the cache.
+
+Usage: ``python benchmarks/user_lookup.py [count]``
+"""
+
+import sys
+import time
+
+import common
+
+
+def main(count):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    from hero import models
+    from hero.registration import registration_cache
+    from hero.utils import MockMember
+
+    models.User.objects.bulk_create([models.User(id=user_id) for user_id in range(1, count + 1)])
+
+    def wrap_all():
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for user_id in range(1, count + 1):
+                models.User.sync_from_discord_obj(MockMember(user_id, 1))
+            elapsed = time.perf_counter() - start
+        return len(queries) / count, elapsed / count * 1e6
+
+    registration_cache.clear()
+    print("uncached: {:.1f} queries, {:.0f} µs per wrap".format(*wrap_all()))
+    print("cached:   {:.1f} queries, {:.0f} µs per wrap".format(*wrap_all()))
+
+
+if __name__ == '__main__':
+    common.setup()
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
+    common.teardown()
@@ -48,6 +48,11 @@ class DiscordHeroConfig(AppConfig):
     name = 'hero'
     verbose_name = "Discord Hero"
 
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from .sqlite import tune_connection
+        connection_created.connect(tune_connection, dispatch_uid='hero_sqlite_tuning')
+
 
 _start_all(globals())
 
@@ -75,7 +80,7 @@ builtins._ = translate
 
 from discord.ext.commands import BucketType, command, check, cooldown, Context
 
-from .utils import async_using_db
+from .utils import async_using_db, run_in_db
 from .conf import Config, Extension, ExtensionConfig
 from .db import Database
 from .cog import Cog, listener
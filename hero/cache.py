@@ -10,6 +10,7 @@ import aiocache
 
 import hero
 from .errors import ConfigurationError
+from .serializers import SERIALIZERS
 
 
 def get_cache(namespace=None):
@@ -102,15 +103,19 @@ def cached(expire_after=None, key=None, include_self=True):
 
 
 def init():
+    serializer_name = os.getenv('CACHE_SERIALIZER', 'json')
+    try:
+        serializer_config = {'class': SERIALIZERS[serializer_name]}
+    except KeyError:
+        raise ConfigurationError("The configuration uses an unsupported cache serializer: "
+                                 "{}".format(serializer_name))
     cache_type = os.getenv('CACHE_TYPE')
     if cache_type == 'simple':
         _cache_config = {
             'default': {
                 'cache': 'aiocache.SimpleMemoryCache',
                 'namespace': 'hero',
-                'serializer': {
-                    'class': 'aiocache.serializers.JsonSerializer'
-                }
+                'serializer': serializer_config
             }
         }
     elif cache_type == 'redis':
@@ -124,9 +129,21 @@ def init():
                 'namespace': 'hero_' + os.getenv('NAMESPACE'),
                 'pool_min_size': 1,
                 'pool_max_size': 10,
-                'serializer': {
-                    'class': 'aiocache.serializers.JsonSerializer'
-                }
+                'serializer': serializer_config
+            }
+        }
+    elif cache_type == 'tiered':
+        _cache_config = {
+            'default': {
+                'cache': 'hero.tiered_cache.TieredCache',
+                'endpoint': os.getenv('CACHE_HOST'),
+                'port': os.getenv('CACHE_PORT'),
+                'password': os.getenv('CACHE_PASSWORD'),
+                'db': os.getenv('CACHE_DB'),
+                'namespace': 'hero_' + os.getenv('NAMESPACE'),
+                'pool_min_size': 1,
+                'pool_max_size': 10,
+                'serializer': serializer_config
             }
         }
     else:
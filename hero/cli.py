@@ -36,7 +36,7 @@ def load_correct_dotenv(ctx, param, is_prod):
 @click.option('--db-password', default=lambda: os.getenv('DB_PASSWORD'))
 @click.option('--db-host', default=lambda: os.getenv('DB_HOST'))
 @click.option('--db-port', default=lambda: os.getenv('DB_PORT'))
-@click.option('--cache-type', type=click.Choice(['simple', 'redis'], case_sensitive=False),
+@click.option('--cache-type', type=click.Choice(['simple', 'redis', 'tiered'], case_sensitive=False),
               default=lambda: os.getenv('CACHE_TYPE', 'simple'))
 @click.option('--cache-host', default=lambda: os.getenv('CACHE_HOST'))
 @click.option('--cache-port', default=lambda: os.getenv('CACHE_PORT'))
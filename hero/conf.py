@@ -208,11 +208,29 @@ class Config:
             'DB_PASSWORD': os.getenv('DB_PASSWORD', None),
             'DB_HOST': os.getenv('DB_HOST', None),
             'DB_PORT': os.getenv('DB_PORT', None),
+            'DB_WORKERS': os.getenv('DB_WORKERS', None),
+            'DB_MAX_STREAMS': os.getenv('DB_MAX_STREAMS', None),
+            'DB_REPLICA_HOSTS': os.getenv('DB_REPLICA_HOSTS', None),
+            'DB_CONN_MAX_AGE': os.getenv('DB_CONN_MAX_AGE', None),
+            'USE_SQLITE_TUNING': os.getenv('USE_SQLITE_TUNING', None),
+            'IDENTITY_MAP_SIZE': os.getenv('IDENTITY_MAP_SIZE', None),
+            'IDENTITY_MAP_TTL': os.getenv('IDENTITY_MAP_TTL', None),
+            'REGISTRATION_CACHE_TTL': os.getenv('REGISTRATION_CACHE_TTL', None),
+            'MESSAGE_BUFFER_SIZE': os.getenv('MESSAGE_BUFFER_SIZE', None),
+            'MESSAGE_BUFFER_INTERVAL': os.getenv('MESSAGE_BUFFER_INTERVAL', None),
+            'RECONCILE_CONCURRENCY': os.getenv('RECONCILE_CONCURRENCY', None),
+            'REST_NEGATIVE_CACHE_TTL': os.getenv('REST_NEGATIVE_CACHE_TTL', None),
+            'GUILD_SNAPSHOT_TTL': os.getenv('GUILD_SNAPSHOT_TTL', None),
             'CACHE_TYPE': os.getenv('CACHE_TYPE', 'simple'),
             'CACHE_HOST': os.getenv('CACHE_HOST', None),
             'CACHE_PORT': os.getenv('CACHE_PORT', None),
             'CACHE_PASSWORD': os.getenv('CACHE_PASSWORD', None),
             'CACHE_DB': os.getenv('CACHE_DB', 0),
+            'CACHE_L1_SIZE': os.getenv('CACHE_L1_SIZE', None),
+            'CACHE_L1_TTL': os.getenv('CACHE_L1_TTL', None),
+            'CACHE_BROKER': os.getenv('CACHE_BROKER', None),
+            'CACHE_SERIALIZER': os.getenv('CACHE_SERIALIZER', None),
+            'CACHE_PICKLE_ALLOWED': os.getenv('CACHE_PICKLE_ALLOWED', None),
             'USE_MEMBERS_INTENT': os.getenv('USE_MEMBERS_INTENT', False),
             'USE_PRESENCE_INTENT': os.getenv('USE_PRESENCE_INTENT', False)
         }
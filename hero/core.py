@@ -31,7 +31,16 @@ from .cache import get_cache
 from .errors import ObjectDoesNotExist, InactiveUser, UserDoesNotExist, ResponseTookTooLong
 from .cli import style
 from .db import Database
-from .utils import issubmodule, MockMember, titlecaseify
+from .executor import current_origin, shutdown_executor
+from .identity import IdentityMap
+from .ingest import MessageBuffer
+from .native import close_engines
+from .reconcile import Reconciler
+from .registration import user_registry
+from .rest import GuildSnapshotCache, RestFetcher
+from .routers import current_invocation, Invocation
+from . import sqlite
+from .utils import async_using_db, issubmodule, MockMember, titlecaseify
 
 
 class CommandConflict(discord.ClientException):
@@ -52,8 +61,14 @@ class Core(commands.Bot):
         self.cache = get_cache(namespace=name)
         # hack that allows Discord models to fetch the Discord object they belong to using the core
         self.cache.core = self
+        self.identity_map = IdentityMap()
+        self.message_buffer = MessageBuffer(self)
+        self.reconciler = Reconciler()
+        self.rest = RestFetcher()
+        self.guild_snapshots = GuildSnapshotCache(self)
         self.db = Database(self)
         self.config = config
+        self._wal_checkpoint_task = None
 
         self.sync_db('hero', interactive=hero.TEST)
 
@@ -100,6 +115,7 @@ class Core(commands.Bot):
             self.clear()
         except AttributeError:
             pass
+        shutdown_executor()
 
     @property
     def is_configured(self):
@@ -122,6 +138,10 @@ class Core(commands.Bot):
         if not existed_already:
             await User.async_create(id=self.user.id)
 
+        # store guilds, channels, roles and members that have been created while the bot was offline
+        # and delete those that have been deleted
+        self.reconciler.schedule_all(self.guilds, members=True)
+
         status = self.settings.status or f"Use {self.default_prefix}help"
         activity = discord.Game(status)
         await self.change_presence(status=discord.Status.online, activity=activity)
@@ -143,6 +163,63 @@ class Core(commands.Bot):
         print(self.get_oauth_url(), "\n")
         print(strings.official_server.format(strings.invite_link), "\n")
 
+    async def fetch_user(self, user_id):
+        return await self.rest.fetch(('user', user_id), super().fetch_user, user_id)
+    fetch_user.__doc__ = commands.Bot.fetch_user.__doc__
+
+    async def fetch_channel(self, channel_id):
+        return await self.rest.fetch(('channel', channel_id), super().fetch_channel, channel_id)
+    fetch_channel.__doc__ = commands.Bot.fetch_channel.__doc__
+
+    async def fetch_guild(self, guild_id):
+        return await self.rest.fetch(('guild', guild_id), super().fetch_guild, guild_id)
+    fetch_guild.__doc__ = commands.Bot.fetch_guild.__doc__
+
+    async def fetch_member(self, guild: discord.Guild, member_id):
+        """Fetches a member of a guild from Discord.
+        Use :meth:`discord.Guild.get_member` first.
+
+        Concurrent fetches of the same member share a single request
+        (see :class:`hero.rest.RestFetcher`).
+        """
+        return await self.rest.fetch(('member', guild.id, member_id), guild.fetch_member, member_id)
+
+    async def fetch_message(self, channel: discord.abc.Messageable, message_id):
+        """Fetches a message of a channel from Discord.
+
+        Concurrent fetches of the same message share a single request
+        (see :class:`hero.rest.RestFetcher`).
+        """
+        return await self.rest.fetch(('message', channel.id, message_id), channel.fetch_message, message_id)
+
+    async def on_guild_join(self, guild):
+        self.rest.forget(('guild', guild.id))
+        self.reconciler.schedule(guild, members=True)
+
+    async def on_member_join(self, member):
+        self.rest.forget(('member', member.guild.id, member.id))
+
+    async def on_guild_channel_create(self, channel):
+        self.rest.forget(('channel', channel.id))
+        self.reconciler.schedule(channel.guild)
+
+    async def on_guild_channel_delete(self, channel):
+        self.reconciler.schedule(channel.guild)
+
+    async def on_guild_role_create(self, role):
+        self.guild_snapshots.invalidate(role.guild.id)
+        self.reconciler.schedule(role.guild)
+
+    async def on_guild_role_delete(self, role):
+        self.guild_snapshots.invalidate(role.guild.id)
+        self.reconciler.schedule(role.guild)
+
+    async def on_guild_role_update(self, before, after):
+        self.guild_snapshots.invalidate(after.guild.id)
+
+    async def on_guild_emojis_update(self, guild, before, after):
+        self.guild_snapshots.invalidate(guild.id)
+
     def clear(self):
         self.recursively_remove_all_commands()
         self.extra_events.clear()
@@ -457,6 +534,37 @@ class Core(commands.Bot):
             if not interactive:
                 sys.stdout = backup_stdout
 
+    async def start(self, *args, **kwargs):
+        if not user_registry.loaded:
+            await async_using_db(user_registry.load)()
+        if sqlite.is_enabled() and self._wal_checkpoint_task is None:
+            self._wal_checkpoint_task = self.loop.create_task(sqlite.checkpoint_periodically())
+        await super().start(*args, **kwargs)
+
+    async def close(self):
+        if self._wal_checkpoint_task is not None:
+            self._wal_checkpoint_task.cancel()
+            self._wal_checkpoint_task = None
+        await self.reconciler.close()
+        await self.message_buffer.close()
+        await super().close()
+        await close_engines()
+
+    async def invoke(self, ctx):
+        # lets slow database operations be traced back to their command
+        token = current_origin.set(f'command {ctx.command.qualified_name}' if ctx.command else None)
+        invocation_token = current_invocation.set(Invocation())
+        try:
+            await super().invoke(ctx)
+        finally:
+            current_invocation.reset(invocation_token)
+            current_origin.reset(token)
+
+    async def _run_event(self, coro, event_name, *args, **kwargs):
+        current_origin.set(f'event {event_name}')
+        current_invocation.set(Invocation())
+        await super()._run_event(coro, event_name, *args, **kwargs)
+
     async def on_message(self, message):
         if not self.is_ready():
             return
@@ -602,7 +710,7 @@ class Core(commands.Bot):
                 payload: discord.RawReactionActionEvent = args[0]
                 user = self.get_user(payload.user_id)
                 if user is None:
-                    user = self.fetch_user(payload.user_id)
+                    user = await self.fetch_user(payload.user_id)
                 channel = self.get_channel(payload.channel_id)
                 if channel is None:
                     channel = await self.fetch_channel(payload.channel_id)
@@ -618,7 +726,7 @@ class Core(commands.Bot):
                 channel = self.get_channel(payload.channel_id)
                 if channel is None:
                     channel = await self.fetch_channel(payload.channel_id)
-                message = await channel.fetch_message(payload.message_id)
+                message = await self.fetch_message(channel, payload.message_id)
                 user = message.author
             elif event_method in ('on_message', 'on_message_delete', 'on_message_edit'):
                 send_message = False
@@ -4,12 +4,323 @@
 :license: Apache-2.0 OR MIT
 """
 
+import asyncio
+from collections import defaultdict
+import contextvars
+import functools
+import itertools
 from typing import Union
 import warnings
 
 import discord
 
-from .utils import MockMember
+from django.db import transaction
+from django.db.models import signals
+
+from .errors import InactiveUser, UserDoesNotExist
+from .registration import Registration, user_registry
+from .utils import async_using_db, MockMember, run_in_db
+
+
+_current_batch = contextvars.ContextVar('hero_current_batch', default=None)
+
+
+class Batch:
+    """Collects the saves, creates and deletes of models that are
+    made inside an ``async with core.db.batch():`` block and writes
+    them to the database at the end of the block, all in one
+    transaction and using bulk queries wherever possible.
+
+    Since the queued operations are only run at the end of the
+    block, queries made inside the block cannot see their effects
+    and objects created inside the block only get an automatically
+    assigned primary key after it. Saving an object that has been
+    created in the same block doesn't write it a second time, and
+    deleting it means it isn't written at all. If the block raises an
+    exception, none of the queued operations are run.
+
+    Batches can be nested; nested blocks join the outermost batch.
+    Tasks started inside the block join the batch as long as it hasn't
+    ended; afterwards their operations are run right away.
+
+    Example: ::
+
+        async with core.db.batch():
+            for member in members:
+                member.level += 1
+                await member.async_save()
+    """
+
+    def __init__(self):
+        self._operations = []
+        self._depth = 0
+        self._token = None
+        self.closed = False
+
+    def create(self, target, **kwargs):
+        model = target if isinstance(target, type) else target.model
+        obj = model(**kwargs)
+        self._operations.append(('create', obj, (), {}))
+        return obj
+
+    def save(self, obj, *args, **kwargs):
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = frozenset(kwargs['update_fields'])
+        self._operations.append(('save', obj, args, kwargs))
+
+    def delete(self, obj, *args, **kwargs):
+        self._operations.append(('delete', obj, args, kwargs))
+
+    async def flush(self):
+        """Writes all operations queued so far to the database."""
+        operations, self._operations = self._operations, []
+        if operations:
+            await _write_operations(operations)
+
+    async def __aenter__(self):
+        if self._depth == 0:
+            self._token = _current_batch.set(self)
+        self._depth += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self._depth -= 1
+        if self._depth > 0:
+            return
+        _current_batch.reset(self._token)
+        # tasks that inherited the batch mustn't queue operations nobody flushes
+        self.closed = True
+        if exc_type is None:
+            await self.flush()
+        else:
+            self._operations.clear()
+
+
+def _bulk_create(model, objs):
+    connection = transaction.get_connection()
+    if (not connection.features.can_return_rows_from_bulk_insert
+            and any(obj.pk is None for obj in objs)):
+        # e.g. SQLite: bulk_create can't assign the automatic primary keys
+        for obj in objs:
+            obj.save(force_insert=True)
+        return
+    using = connection.alias
+    for obj in objs:
+        signals.pre_save.send(sender=model, instance=obj, raw=False, using=using, update_fields=None)
+    model.objects.bulk_create(objs)
+    for obj in objs:
+        signals.post_save.send(sender=model, instance=obj, created=True, raw=False,
+                               using=using, update_fields=None)
+
+
+def _bulk_save(model, operations):
+    using = transaction.get_connection().alias
+    # objects saved several times only have to be written once
+    operations = {id(obj): (obj, args, kwargs) for _, obj, args, kwargs in operations}
+    updates = {}
+    for obj, args, kwargs in operations.values():
+        if obj._state.adding or args or set(kwargs) - {'update_fields'}:
+            # bulk_update cannot insert rows or handle save's other options
+            obj.save(*args, **kwargs)
+        else:
+            updates.setdefault(kwargs.get('update_fields'), []).append(obj)
+
+    for update_fields, objs in updates.items():
+        if update_fields is None:
+            fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+        else:
+            fields = [model._meta.get_field(name) for name in update_fields]
+        for obj in objs:
+            signals.pre_save.send(sender=model, instance=obj, raw=False, using=using, update_fields=update_fields)
+            for field in fields:
+                # applies auto_now and the like, just like save does
+                setattr(obj, field.attname, field.pre_save(obj, False))
+        model.objects.bulk_update(objs, [field.name for field in fields])
+        for obj in objs:
+            signals.post_save.send(sender=model, instance=obj, created=False, raw=False,
+                                   using=using, update_fields=update_fields)
+
+
+def _fold_operations(operations):
+    """Drops the saves of objects that are created by an earlier
+    operation since the insert writes their current state anyway,
+    and both the creation and the deletion of objects that are
+    deleted after being created.
+    """
+    created = {id(obj) for kind, obj, _, _ in operations if kind == 'create'}
+    if not created:
+        return operations
+    deleted = set()
+    pending = set()
+    for kind, obj, _, _ in operations:
+        if id(obj) not in created:
+            continue
+        if kind == 'create':
+            pending.add(id(obj))
+        elif kind == 'delete' and id(obj) in pending:
+            deleted.add(id(obj))
+    return [(kind, obj, args, kwargs) for kind, obj, args, kwargs in operations
+            if id(obj) not in deleted and not (kind == 'save' and id(obj) in created)]
+
+
+@async_using_db
+def _write_operations(operations):
+    operations = _fold_operations(operations)
+    with transaction.atomic():
+        # consecutive operations of the same kind on the same model
+        # can be combined without changing the order of the writes
+        for (kind, model), group in itertools.groupby(operations, key=lambda op: (op[0], type(op[1]))):
+            group = list(group)
+            if kind == 'create':
+                _bulk_create(model, list({id(obj): obj for _, obj, _, _ in group}.values()))
+            elif kind == 'save':
+                _bulk_save(model, group)
+            else:
+                for _, obj, args, kwargs in group:
+                    obj.delete(*args, **kwargs)
+
+
+def batchable(operation):
+    """Decorator for model methods decorated with :func:`hero.async_using_db`
+    that queues the operation in the current :class:`Batch` instead
+    of running it right away if called inside a batch block.
+
+    :param operation:
+        The name of the :class:`Batch` method that queues the operation.
+    :type operation: str
+    """
+    def decorator(fallback):
+        @functools.wraps(fallback.func)
+        async def wrapped(target, *args, **kwargs):
+            batch = _current_batch.get()
+            if batch is None or batch.closed:
+                return await fallback(target, *args, **kwargs)
+            return getattr(batch, operation)(target, *args, **kwargs)
+
+        wrapped.sync = fallback.sync
+        return wrapped
+
+    return decorator
+
+
+def _get_or_create_many(model, rows):
+    # rows: pk -> kwargs the instance is created with if it doesn't exist yet
+    objs = model.objects.in_bulk(list(rows))
+    missing = [model(pk=pk, **kwargs) for pk, kwargs in rows.items() if pk not in objs]
+    if missing:
+        model.objects.bulk_create(missing, ignore_conflicts=True)
+        objs.update((obj.pk, obj) for obj in missing)
+    return objs
+
+
+def _check_user(discord_user):
+    # same checks as User.sync_from_discord_obj
+    if isinstance(discord_user, (MockMember, discord.Object)):
+        return False
+    if discord_user.id == discord_user._state.user.id:
+        return True
+    if discord_user.bot:
+        raise ValueError("Bot users cannot be stored in the database")
+    return False
+
+
+def _get_users(discord_users):
+    from hero.models import User
+
+    # the bot user is the only one that can be created without registering;
+    # it is created by bulk inserts the registry doesn't learn about
+    bot_ids = {discord_user.id for discord_user in discord_users if _check_user(discord_user)}
+    for discord_user in discord_users:
+        if discord_user.id in bot_ids:
+            continue
+        # unknown users are checked by the query below
+        if user_registry.get(discord_user.id) is Registration.INACTIVE:
+            raise InactiveUser(user_id=discord_user.id)
+    users = _get_or_create_many(User, {user_id: {} for user_id in bot_ids})
+    users.update(User.objects.in_bulk([discord_user.id for discord_user in discord_users
+                                       if discord_user.id not in bot_ids]))
+    for discord_user in discord_users:
+        user = users.get(discord_user.id)
+        if user is None:
+            raise UserDoesNotExist(user_id=discord_user.id)
+        if not user.is_active:
+            raise InactiveUser(user_id=discord_user.id)
+    return users
+
+
+def _check_identity_hit(obj):
+    """Raises :class:`InactiveUser` if the user of an instance found in
+    the identity map has unregistered since it was put there. Saving the
+    instance in the map itself doesn't remove it from the map.
+    """
+    from hero.models import User, Member
+
+    if isinstance(obj, User):
+        user_id, user = obj.id, obj
+    elif isinstance(obj, Member):
+        user_id, user = obj.__dict__['user_id'], obj._state.fields_cache.get('user')
+    else:
+        return
+    if (user is not None and not user.is_active) or user_registry.get(user_id) is Registration.INACTIVE:
+        raise InactiveUser(f"The user {user_id} is inactive", user_id=user_id)
+
+
+@async_using_db
+def _wrap_many(pending):
+    from hero.models import (User, Guild, TextChannel, VoiceChannel,
+                             CategoryChannel, Role, Member)
+
+    by_model = defaultdict(list)
+    for index, model, discord_obj in pending:
+        by_model[model].append((index, discord_obj))
+
+    guild_ids = set()
+    for model, items in by_model.items():
+        if model is Guild:
+            guild_ids.update(discord_obj.id for _, discord_obj in items)
+        elif model is not User:
+            guild_ids.update(discord_obj.guild.id for _, discord_obj in items)
+
+    results = []
+    with transaction.atomic():
+        # guilds first since all other models except users refer to them
+        guilds = _get_or_create_many(Guild, {guild_id: {} for guild_id in guild_ids})
+        results.extend((index, guilds[discord_obj.id]) for index, discord_obj in by_model.pop(Guild, ()))
+
+        for model in (TextChannel, VoiceChannel, CategoryChannel, Role):
+            items = by_model.pop(model, ())
+            if not items:
+                continue
+            extra = {'is_dm': False} if model is TextChannel else {}
+            objs = _get_or_create_many(model, {discord_obj.id: dict(guild_id=discord_obj.guild.id, **extra)
+                                               for _, discord_obj in items})
+            results.extend((index, objs[discord_obj.id]) for index, discord_obj in items)
+
+        items = by_model.pop(User, ())
+        if items:
+            users = _get_users([discord_obj for _, discord_obj in items])
+            results.extend((index, users[discord_obj.id]) for index, discord_obj in items)
+
+        items = by_model.pop(Member, ())
+        if items:
+            _get_users([discord_obj._user if isinstance(discord_obj, discord.Member) else discord_obj
+                        for _, discord_obj in items])
+            keys = {(discord_obj.id, discord_obj.guild.id) for _, discord_obj in items}
+
+            def get_members():
+                members = Member.objects.filter(user_id__in={user_id for user_id, _ in keys},
+                                                guild_id__in={guild_id for _, guild_id in keys})
+                return {(member.user_id, member.guild_id): member for member in members}
+
+            members = get_members()
+            missing = keys - set(members)
+            if missing:
+                Member.objects.bulk_create([Member(user_id=user_id, guild_id=guild_id) for user_id, guild_id in missing],
+                                           ignore_conflicts=True)
+                # the primary keys of the created members aren't known
+                members = get_members()
+            results.extend((index, members[(discord_obj.id, discord_obj.guild.id)]) for index, discord_obj in items)
+    return results
 
 
 class Database:
@@ -34,6 +345,33 @@ class Database:
         }
         self._models = tuple(self._model_map.values())
         self._discord_classes = tuple(self._model_map.keys())
+        if core is not None:
+            for model in self._models:
+                self.identity_map.watch(model)
+
+    @property
+    def identity_map(self):
+        """The :class:`hero.identity.IdentityMap` of the :class:`hero.Core`
+        that keeps the instances Discord objects have been wrapped in.
+        """
+        return self.core.identity_map
+
+    def batch(self):
+        """Returns the :class:`Batch` of the current block or a new
+        :class:`Batch` if not inside a batch block.
+        Use with ``async with``.
+        """
+        batch = _current_batch.get()
+        if batch is None or batch.closed:
+            batch = Batch()
+        return batch
+
+    async def atomic(self, func, *args, **kwargs):
+        """Runs the synchronous function ``func(*args, **kwargs)`` on a
+        database worker inside a transaction and returns its result.
+        See :func:`hero.run_in_db` for more details.
+        """
+        return await run_in_db(func, *args, **kwargs)
 
     async def load(self, discord_obj):
         warnings.warn("Database.load is deprecated; use Database.wrap_{} methods instead", DeprecationWarning)
@@ -43,7 +381,16 @@ class Database:
     async def _load(self, discord_obj, create_if_new=True):
         if isinstance(discord_obj, self._discord_classes):
             cls = self._model_map[type(discord_obj)]
+            identity_map = self.identity_map
+            if identity_map.enabled:
+                obj = identity_map.get(cls, cls._get_identity_key(discord_obj))
+                if obj is not None:
+                    _check_identity_hit(obj)
+                    obj._attach_discord_obj(discord_obj)
+                    return obj, True
+            generation = identity_map.generation
             obj, existed_already = await cls.from_discord_obj(discord_obj, create_if_new=create_if_new)
+            identity_map.put(obj, generation=generation)
             return obj, existed_already
         elif isinstance(discord_obj, self._models):
             try:
@@ -153,7 +500,7 @@ class Database:
         member, _ = await self._load(member)
         return member
 
-    async def wrap_message(self, message: discord.Message, create_if_new=True):
+    async def wrap_message(self, message: discord.Message, create_if_new=True, buffered=False):
         """Wrap a Message object obtained from Discord
         in a hero.Message to provide it with
         database-related functionalities (see hero.Model,
@@ -161,6 +508,190 @@ class Database:
         The returned hero.Message will still have all the
         attributes and methods of the discord.Message
         that it is holding inside.
+
+        If ``buffered`` is ``True``, the message is added to the
+        :class:`hero.ingest.MessageBuffer` of the :class:`hero.Core`
+        instead, which stores it (and its guild and channel) in the
+        background, and the returned hero.Message is not saved yet.
+        Use this for storing a lot of messages.
         """
+        if buffered:
+            return self.core.message_buffer.add(message)
         message, _ = await self._load(message, create_if_new=create_if_new)
         return message
+
+    async def wrap_many(self, discord_objs):
+        """Wrap many objects obtained from Discord at once, e.g. all
+        channels of a guild or all roles mentioned in a message.
+
+        Works like calling the respective ``wrap_*`` method for every
+        object, but needs only a few queries per model instead of a
+        few queries per object: existing rows are loaded using one
+        ``in_bulk`` query per model and missing rows are inserted
+        using one bulk insert per model.
+
+        :param discord_objs:
+            The objects to wrap. May contain objects of different types.
+        :type discord_objs: Iterable[Union[discord.User, discord.Guild, discord.TextChannel,
+            discord.VoiceChannel, discord.CategoryChannel, discord.Role, discord.Emoji,
+            discord.PartialEmoji, discord.Member, discord.Message]]
+        :raises UserDoesNotExist:
+            One of the users (or members) is not registered.
+        :raises InactiveUser:
+            One of the users (or members) has unregistered.
+        :return:
+            The wrapped objects, in the order of ``discord_objs``.
+        :rtype: List[hero.DiscordModel]
+        """
+        from hero.models import Emoji, Message
+
+        discord_objs = list(discord_objs)
+        results = [None] * len(discord_objs)
+        identity_map = self.identity_map
+        generation = identity_map.generation
+        pending = []
+        for index, discord_obj in enumerate(discord_objs):
+            model = self._model_map.get(type(discord_obj))
+            if model is None:
+                raise TypeError("obj has to be an object from Discord")
+            if identity_map.enabled:
+                obj = identity_map.get(model, model._get_identity_key(discord_obj))
+                if obj is not None:
+                    _check_identity_hit(obj)
+                    obj._attach_discord_obj(discord_obj)
+                    results[index] = obj
+                    continue
+            pending.append((index, model, discord_obj))
+
+        # emojis and messages aren't worth the complexity of bulk loading
+        single = [item for item in pending if item[1] in (Emoji, Message)]
+        bulk = [item for item in pending if item[1] not in (Emoji, Message)]
+        if bulk:
+            for index, obj in await _wrap_many(bulk):
+                obj._attach_discord_obj(discord_objs[index])
+                identity_map.put(obj, generation=generation)
+                results[index] = obj
+        for index, _, discord_obj in single:
+            results[index], _ = await self._load(discord_obj)
+        return results
+
+    def _get_cached_discord_obj(self, obj, messages):
+        from hero.models import User, Guild, TextChannel, VoiceChannel, CategoryChannel, Role, Emoji, Member, Message
+
+        core = self.core
+        # foreign keys are read from __dict__ since accessing them here would return coroutines
+        if isinstance(obj, User):
+            if not obj.is_active:
+                raise InactiveUser(f"The user {obj.id} is inactive", user_id=obj.id)
+            return core.get_user(obj.id)
+        if isinstance(obj, Guild):
+            return core.get_guild(obj.id)
+        if isinstance(obj, (TextChannel, VoiceChannel, CategoryChannel)):
+            return core.get_channel(obj.id)
+        if isinstance(obj, Role):
+            guild = core.get_guild(obj.__dict__['guild_id'])
+            return guild.get_role(obj.id) if guild is not None else None
+        if isinstance(obj, Member):
+            guild = core.get_guild(obj.__dict__['guild_id'])
+            return guild.get_member(obj.__dict__['user_id']) if guild is not None else None
+        if isinstance(obj, Message):
+            return messages.get(obj.id)
+        if isinstance(obj, Emoji):
+            if not obj.is_custom:
+                return discord.PartialEmoji(name=obj.name)
+            emoji = core.get_emoji(obj.id)
+            if emoji is not None:
+                return discord.PartialEmoji(name=emoji.name, animated=emoji.animated, id=emoji.id)
+            return None
+        raise TypeError(f"Cannot fetch a {type(obj).__name__}")
+
+    async def fetch_many(self, objs, concurrency=8):
+        """Fetches the Discord objects of many Hero objects at once
+        and attaches them like :meth:`hero.DiscordModel.fetch` would.
+
+        Discord objects in discord.py's cache are used right away.
+        Members that aren't cached are requested through the gateway,
+        using one request per guild and 100 members. Everything else
+        is fetched from the API using :meth:`hero.DiscordModel.fetch`,
+        at most ``concurrency`` objects at a time.
+
+        :param objs:
+            The objects to fetch. May contain objects of different models.
+        :type objs: Iterable[hero.DiscordModel]
+        :param concurrency:
+            How many objects may be fetched from the API at the same time.
+        :type concurrency: int
+        :return:
+            The Discord objects, in the order of ``objs``. If an object
+            couldn't be fetched, the exception that was raised is
+            returned in its place instead.
+        :rtype: List[Union[discord.abc.Snowflake, discord.PartialEmoji, Exception]]
+        """
+        from hero.models import Member, Message
+
+        objs = list(objs)
+        results = [None] * len(objs)
+        messages = {}
+        if any(isinstance(obj, Message) for obj in objs):
+            messages = {message.id: message for message in self.core.cached_messages}
+        misses = []
+        for index, obj in enumerate(objs):
+            try:
+                discord_obj = self._get_cached_discord_obj(obj, messages)
+            except Exception as error:
+                results[index] = error
+                continue
+            if discord_obj is None:
+                misses.append(index)
+            else:
+                obj._discord_obj = discord_obj
+                results[index] = discord_obj
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        # request uncached members through the gateway
+        members_by_guild = defaultdict(list)
+        for index in misses:
+            obj = objs[index]
+            if isinstance(obj, Member) and self.core.get_guild(obj.__dict__['guild_id']) is not None:
+                members_by_guild[obj.__dict__['guild_id']].append(index)
+
+        async def query_members(guild, user_ids):
+            async with semaphore:
+                try:
+                    return await guild.query_members(user_ids=user_ids, limit=len(user_ids))
+                except (discord.ClientException, asyncio.TimeoutError):
+                    # e.g. the members intent is disabled; fall back to the API
+                    return []
+
+        queries = []
+        for guild_id, indices in members_by_guild.items():
+            guild = self.core.get_guild(guild_id)
+            user_ids = list({objs[index].__dict__['user_id'] for index in indices})
+            for start in range(0, len(user_ids), 100):
+                queries.append(query_members(guild, user_ids[start:start + 100]))
+        found = {}
+        for members in await asyncio.gather(*queries):
+            found.update(((member.guild.id, member.id), member) for member in members)
+        remaining = []
+        for index in misses:
+            obj = objs[index]
+            member = found.get((obj.__dict__.get('guild_id'), obj.__dict__.get('user_id'))) \
+                if isinstance(obj, Member) else None
+            if member is not None:
+                obj._discord_obj = member
+                results[index] = member
+            else:
+                remaining.append(index)
+
+        # fetch the rest from the API
+        async def fetch(obj):
+            async with semaphore:
+                return await obj.fetch()
+
+        fetched = await asyncio.gather(*(fetch(objs[index]) for index in remaining), return_exceptions=True)
+        for index, discord_obj in zip(remaining, fetched):
+            if isinstance(discord_obj, asyncio.CancelledError):
+                raise discord_obj
+            results[index] = discord_obj
+        return results
@@ -69,3 +69,20 @@ DATABASE_OPTIONS = {
 DATABASES = {
     'default': DATABASE_OPTIONS[os.getenv('DB_TYPE', 'sqlite')]
 }
+
+# Database connections are kept open and recycled after DB_CONN_MAX_AGE seconds;
+# they are never recycled because of their age if it is not set
+_conn_max_age = os.getenv('DB_CONN_MAX_AGE')
+DATABASES['default']['CONN_MAX_AGE'] = int(_conn_max_age) if _conn_max_age else None
+
+# Read replicas of the default database, separated by semicolons,
+# e.g. DB_REPLICA_HOSTS=replica1.example.com;replica2.example.com:5433
+_replica_hosts = os.getenv('DB_REPLICA_HOSTS')
+if _replica_hosts and os.getenv('DB_TYPE', 'sqlite') != 'sqlite':
+    for _index, _replica_host in enumerate(_replica_hosts.split(';')):
+        _host, _, _port = _replica_host.partition(':')
+        DATABASES[f'replica_{_index}'] = dict(DATABASES['default'], HOST=_host,
+                                              PORT=int(_port) if _port else DATABASES['default']['PORT'],
+                                              TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['hero.routers.ReplicaRouter']
@@ -0,0 +1,408 @@
+"""discord-hero: Discord Application Framework for humans
+
+:copyright: (c) 2019-2020 monospacedmagic et al.
+:license: Apache-2.0 OR MIT
+"""
+
+import asyncio
+from concurrent.futures import Future
+import contextlib
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+
+from . import metrics
+
+
+logger = logging.getLogger('hero.db')
+
+current_origin = contextvars.ContextVar('hero_current_origin', default=None)
+"""The command or event listener that is currently being run, e.g.
+``'command ping'`` or ``'event on_message'``. Set by the :class:`hero.Core`
+and reported for slow database operations.
+"""
+
+QUEUE_DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+MAX_LOGGED_QUERIES = 50
+
+
+class DatabaseExecutor:
+    """Runs database operations on a pool of worker threads.
+
+    Every worker thread holds its own Django database connection,
+    so independent queries issued by concurrent commands run in
+    parallel instead of queueing up behind each other.
+
+    SQLite only allows one writer at a time, which is why one worker
+    is reserved for writes when using SQLite while the other workers
+    only run read-only operations.
+
+    :param max_workers:
+        The number of worker threads. Defaults to the value of the
+        ``DB_WORKERS`` environment variable or ``4``.
+    :type max_workers: Optional[int]
+    :param single_writer:
+        Whether all writes should be run by a single dedicated worker.
+        Defaults to ``True`` if the database backend is SQLite.
+    :type single_writer: Optional[bool]
+    :param slow_threshold:
+        Operations that take longer than this many seconds from being
+        scheduled to being finished are logged as warnings on the
+        ``hero.db`` logger, together with the SQL they ran and the
+        command or event listener they were run for. Defaults to the
+        value of the ``DB_SLOW_THRESHOLD`` environment variable (in
+        milliseconds) or 500 ms. ``0`` disables the slow operation log.
+    :type slow_threshold: Optional[float]
+    :param ping_after:
+        Connections that have been idle for longer than this many seconds
+        are checked with a ping before they are used again and reopened
+        if they are broken. Defaults to the value of the ``DB_PING_AFTER``
+        environment variable or ``30``.
+    :type ping_after: Optional[float]
+    :param max_queries:
+        Connections are recycled after running this many queries.
+        Defaults to the value of the ``DB_CONN_MAX_QUERIES`` environment
+        variable or ``0``, which means that they are never recycled
+        because of the number of queries they ran.
+    :type max_queries: Optional[int]
+    :param max_streams:
+        The maximum number of :class:`DedicatedWorker`\ s started with
+        :meth:`start_dedicated` that can be open at the same time; each
+        holds a connection of its own. Further streams wait for one of
+        them to be closed. Defaults to the value of the ``DB_MAX_STREAMS``
+        environment variable or ``4``.
+    :type max_streams: Optional[int]
+
+    Connections are kept open between operations and are recycled after
+    ``CONN_MAX_AGE`` seconds (see the ``DB_CONN_MAX_AGE`` environment
+    variable). Read-only operations that fail because their connection
+    was lost, e.g. after a database failover, are retried once on a new
+    connection.
+
+    The executor records the following :class:`hero.metrics.Histogram`\ s:
+
+    ``db.queue_depth``
+        The number of operations waiting for a worker when an
+        operation is scheduled.
+    ``db.function.<qualified name>.wait`` and ``db.model.<model label>.wait``
+        How long operations waited for a worker, in seconds.
+    ``db.function.<qualified name>.execution`` and ``db.model.<model label>.execution``
+        How long operations took to run once a worker picked them up, in seconds.
+    """
+
+    def __init__(self, max_workers=None, single_writer=None, slow_threshold=None,
+                 ping_after=None, max_queries=None, max_streams=None):
+        if max_workers is None:
+            max_workers = int(os.getenv('DB_WORKERS', 4))
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        if single_writer is None:
+            from django.conf import settings
+            single_writer = settings.DATABASES['default']['ENGINE'].endswith('sqlite3')
+        if slow_threshold is None:
+            slow_threshold = float(os.getenv('DB_SLOW_THRESHOLD', 500)) / 1000
+        if ping_after is None:
+            ping_after = float(os.getenv('DB_PING_AFTER', 30))
+        if max_queries is None:
+            max_queries = int(os.getenv('DB_CONN_MAX_QUERIES', 0))
+        if max_streams is None:
+            max_streams = int(os.getenv('DB_MAX_STREAMS', 4))
+        if max_streams < 1:
+            raise ValueError("max_streams must be at least 1")
+
+        self.max_workers = max_workers
+        self.single_writer = single_writer and max_workers > 1
+        self.slow_threshold = slow_threshold
+        self.ping_after = ping_after
+        self.max_queries = max_queries
+        self.max_streams = max_streams
+        self._streams = None
+        self.queue_depth = 0
+        self._read_queue = queue.SimpleQueue()
+        self._write_queue = queue.SimpleQueue() if self.single_writer else self._read_queue
+        self._workers = []
+        self._dedicated_workers = set()
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def _start_workers(self):
+        if self.single_writer:
+            work_queues = [self._write_queue] + [self._read_queue] * (self.max_workers - 1)
+        else:
+            work_queues = [self._read_queue] * self.max_workers
+        for index, work_queue in enumerate(work_queues):
+            thread = threading.Thread(target=self._work, args=(work_queue,),
+                                      name=f'hero-db-{index}', daemon=True)
+            thread.start()
+            self._workers.append((thread, work_queue))
+
+    def _work(self, work_queue, manage_connections=True):
+        from django.db import connections
+
+        # alias -> [time of the last query, number of queries] of the open connections
+        usage = {}
+        try:
+            while True:
+                work_item = work_queue.get()
+                if work_item is None:
+                    break
+                future, func, operation = work_item
+                with self._lock:
+                    self.queue_depth -= 1
+                if not future.set_running_or_notify_cancel():
+                    continue
+                readonly = operation[-1]
+                if manage_connections:
+                    self._check_out_connections(usage)
+                started_at = time.perf_counter()
+                queries = []
+                try:
+                    result = self._call(func, queries, usage, retry=readonly and manage_connections)
+                except BaseException as error:
+                    future.set_exception(error)
+                    self._close_broken_connections()
+                else:
+                    future.set_result(result)
+                self._record(operation, started_at, time.perf_counter(), queries)
+        finally:
+            # each worker owns its connections, so it has to close them itself
+            connections.close_all()
+
+    def _call(self, func, queries, usage, retry):
+        from django.db import InterfaceError, OperationalError
+
+        try:
+            with self._capture_queries(queries, usage):
+                return func()
+        except (OperationalError, InterfaceError) as error:
+            if not (self._close_broken_connections() and retry):
+                raise
+            logger.info("Retrying read-only database operation after losing the connection: %s", error)
+        # only reached if retrying
+        with self._capture_queries(queries, usage):
+            return func()
+
+    def _check_out_connections(self, usage):
+        from django.db import connections
+
+        now = time.monotonic()
+        for connection in connections.all():
+            if connection.connection is None:
+                usage.pop(connection.alias, None)
+                continue
+            last_used, query_count = usage.get(connection.alias, (now, 0))
+            if self.max_queries and query_count >= self.max_queries:
+                connection.close()
+            else:
+                # closes the connection if it is older than CONN_MAX_AGE
+                connection.close_if_unusable_or_obsolete()
+                if (connection.connection is not None and now - last_used > self.ping_after
+                        and not connection.is_usable()):
+                    connection.close()
+            if connection.connection is None:
+                usage.pop(connection.alias, None)
+
+    @staticmethod
+    def _close_broken_connections():
+        """Closes the connections that errors have occurred on if they
+        are not usable anymore. Returns whether any connection was closed.
+        """
+        from django.db import connections
+
+        closed = False
+        for connection in connections.all():
+            if connection.connection is None or not connection.errors_occurred:
+                continue
+            if connection.is_usable():
+                connection.errors_occurred = False
+            else:
+                # reconnect lazily on the next operation
+                connection.close()
+                closed = True
+        return closed
+
+    @contextlib.contextmanager
+    def _capture_queries(self, queries, usage):
+        from django.db import connections
+
+        def wrapper(alias):
+            def capture(execute, sql, params, many, context):
+                if self.slow_threshold and len(queries) < MAX_LOGGED_QUERIES:
+                    queries.append(sql)
+                try:
+                    return execute(sql, params, many, context)
+                finally:
+                    connection_usage = usage.setdefault(alias, [0.0, 0])
+                    connection_usage[0] = time.monotonic()
+                    connection_usage[1] += 1
+
+            return capture
+
+        with contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(wrapper(connection.alias)))
+            yield
+
+    def _record(self, operation, started_at, finished_at, queries):
+        name, model, origin, scheduled_at, _ = operation
+        wait = started_at - scheduled_at
+        execution = finished_at - started_at
+        metrics.get_histogram(f'db.function.{name}.wait').observe(wait)
+        metrics.get_histogram(f'db.function.{name}.execution').observe(execution)
+        if model is not None:
+            metrics.get_histogram(f'db.model.{model._meta.label}.wait').observe(wait)
+            metrics.get_histogram(f'db.model.{model._meta.label}.execution').observe(execution)
+        if self.slow_threshold and wait + execution > self.slow_threshold:
+            logger.warning("Slow database operation %s%s for %s: waited %.1f ms, ran %.1f ms\n%s",
+                           name, f' on {model._meta.label}' if model is not None else '',
+                           origin or 'unknown origin', wait * 1000, execution * 1000,
+                           '\n'.join(queries) or 'no queries')
+
+    def submit(self, func, *, readonly=False, name=None, model=None) -> Future:
+        """Schedules ``func()`` to be run by a worker.
+
+        :param readonly:
+            Whether ``func`` only reads from the database. Read-only
+            operations may run in parallel to a write on SQLite.
+        :type readonly: bool
+        :param name:
+            The name ``func`` is recorded under. Defaults to
+            its qualified name.
+        :type name: Optional[str]
+        :param model:
+            The model ``func`` operates on, if any.
+        :type model: Optional[Type[hero.models.Model]]
+        :rtype: concurrent.futures.Future
+        """
+        work_queue = self._read_queue if readonly else self._write_queue
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new database operations after shutdown")
+            if not self._workers:
+                self._start_workers()
+            return self._schedule(work_queue, func, name, model, readonly)
+
+    def _schedule(self, work_queue, func, name, model, readonly=False):
+        # must be called with self._lock held
+        if name is None:
+            name = getattr(func, '__qualname__', type(func).__qualname__)
+        future = Future()
+        operation = (name, model, current_origin.get(), time.perf_counter(), readonly)
+        metrics.get_histogram('db.queue_depth', QUEUE_DEPTH_BUCKETS).observe(self.queue_depth)
+        self.queue_depth += 1
+        work_queue.put((future, func, operation))
+        return future
+
+    async def run(self, func, *, readonly=False, name=None, model=None):
+        """Runs ``func()`` on a worker and returns its result.
+        Exceptions raised by ``func`` are propagated to the caller.
+        """
+        return await asyncio.wrap_future(self.submit(func, readonly=readonly, name=name, model=model))
+
+    def dedicated(self) -> 'DedicatedWorker':
+        """Starts a :class:`DedicatedWorker` for operations that have to
+        run on the same connection, e.g. to iterate over a server-side
+        cursor. Close it once it isn't needed anymore.
+        """
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new database operations after shutdown")
+            worker = DedicatedWorker(self)
+            self._dedicated_workers.add(worker)
+            return worker
+
+    async def start_dedicated(self) -> 'DedicatedWorker':
+        """Like :meth:`dedicated`, but waits until fewer than
+        :attr:`max_streams` workers started this way are open.
+        """
+        if self._streams is None:
+            self._streams = asyncio.Semaphore(self.max_streams)
+        await self._streams.acquire()
+        try:
+            worker = self.dedicated()
+        except BaseException:
+            self._streams.release()
+            raise
+        worker._slot = self._streams
+        return worker
+
+    def shutdown(self, wait=True):
+        """Stops all workers after they have finished the operations
+        that have already been scheduled and closes their connections.
+        """
+        with self._lock:
+            self._shutdown = True
+            for _, work_queue in self._workers:
+                work_queue.put(None)
+            workers = self._workers + [(worker._thread, worker._queue) for worker in self._dedicated_workers]
+            for worker in self._dedicated_workers:
+                worker._queue.put(None)
+            self._dedicated_workers.clear()
+        if wait:
+            for thread, _ in workers:
+                thread.join()
+
+
+class DedicatedWorker:
+    """A worker thread with its own connection that only runs the
+    operations of the code that started it.
+
+    Use :meth:`DatabaseExecutor.dedicated` to start one.
+    """
+
+    def __init__(self, executor: DatabaseExecutor):
+        self.executor = executor
+        self._slot = None
+        self._queue = queue.SimpleQueue()
+        # the connection must stay open for as long as a server-side cursor uses it
+        self._thread = threading.Thread(target=executor._work, args=(self._queue, False),
+                                        name='hero-db-dedicated', daemon=True)
+        self._thread.start()
+
+    async def run(self, func, *, name=None, model=None):
+        """Runs ``func()`` on this worker and returns its result.
+        Exceptions raised by ``func`` are propagated to the caller.
+        """
+        with self.executor._lock:
+            future = self.executor._schedule(self._queue, func, name, model)
+        return await asyncio.wrap_future(future)
+
+    def close(self):
+        """Stops the worker after it has finished the operations
+        that have already been scheduled and closes its connection.
+        """
+        with self.executor._lock:
+            if self in self.executor._dedicated_workers:
+                self.executor._dedicated_workers.remove(self)
+                self._queue.put(None)
+        if self._slot is not None:
+            slot, self._slot = self._slot, None
+            slot.release()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> DatabaseExecutor:
+    """Returns the :class:`DatabaseExecutor` shared by the whole process,
+    creating it first if necessary.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = DatabaseExecutor()
+    return _executor
+
+
+def shutdown_executor(wait=True):
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
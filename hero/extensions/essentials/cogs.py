@@ -14,6 +14,7 @@ from discord import RawReactionActionEvent
 import hero
 from hero import checks, models, strings
 from hero.errors import InactiveUser, UserDoesNotExist
+from hero.registration import Registration, user_registry
 
 
 class Essentials(hero.Cog):
@@ -106,6 +107,11 @@ class Essentials(hero.Cog):
         # obligatory checks for efficiency
         if user_id == self.core.user.id or emoji.is_custom_emoji() or emoji.name != self.core.YES_EMOJI:
             return
+        # only inactive users can have a register_message
+        if user_registry.get(user_id) is Registration.ACTIVE:
+            return
+        if await models.User.async_lookup(user_id) is not Registration.INACTIVE:
+            return
 
         # check if message is user's register_message
         user = models.User(id=user_id)
@@ -11,6 +11,7 @@ import threading
 import discord
 
 from django.core.exceptions import SynchronousOnlyOperation
+from django.db.models import prefetch_related_objects
 from django.db.models import (AutoField, BigAutoField, BigIntegerField, BooleanField, CharField as _CharField,
                               CASCADE, DateField, DateTimeField, DecimalField, DO_NOTHING, FloatField,
                               ForeignKey as _ForeignKey, ForeignObject,
@@ -48,10 +49,77 @@ class ForeignKeyDeferredAttribute(_ForeignKeyDeferredAttribute):
                     # if accessed from an async context to make behavior more consistent
                     return maybe_coroutine(super(ForeignKeyDeferredAttribute, self).__get__, instance, cls=cls)
                 else:
-                    return async_using_db(super(ForeignKeyDeferredAttribute, self).__get__)(instance, cls=cls)
+                    return async_using_db.readonly(super(ForeignKeyDeferredAttribute, self).__get__)(instance, cls=cls)
             return super(ForeignKeyDeferredAttribute, self).__get__(instance, cls=cls)
 
 
+class RelatedObjectLoader:
+    """Batches the loads of related objects that are awaited in the same
+    iteration of the event loop, for example: ::
+
+        users = await asyncio.gather(*(member.user for member in members))
+
+    The related objects of all instances that access the same field are
+    loaded using a single ``IN`` query and handed back to the
+    coroutines awaiting them.
+    """
+
+    def __init__(self):
+        # (event loop, field) -> [(instance, future)]
+        self._batches = {}
+
+    def load(self, event_loop, field, getter, instance):
+        """Returns a future for the related object ``getter(instance)``
+        will return once ``field`` has been loaded for ``instance``.
+        """
+        key = (event_loop, field)
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = []
+            event_loop.call_soon(self._dispatch, key, getter)
+        future = event_loop.create_future()
+        batch.append((instance, future))
+        return future
+
+    def _dispatch(self, key, getter):
+        batch = self._batches.pop(key)
+        asyncio.ensure_future(self._resolve(key[1], getter, batch), loop=key[0])
+
+    async def _resolve(self, field, getter, batch):
+        try:
+            results = await self._load(field, getter, [instance for instance, _ in batch])
+        except asyncio.CancelledError:
+            for _, future in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            results = [(False, e)] * len(batch)
+        for (_, future), (ok, value) in zip(batch, results):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    @staticmethod
+    @async_using_db.readonly
+    def _load(field, getter, instances):
+        unique_instances = list({id(instance): instance for instance in instances}.values())
+        prefetch_related_objects(unique_instances, field.name)
+        results = []
+        for instance in instances:
+            # cached now, or raises the DoesNotExist error it would have raised
+            try:
+                results.append((True, getter(instance)))
+            except Exception as e:
+                results.append((False, e))
+        return results
+
+
+related_object_loader = RelatedObjectLoader()
+
+
 class ForwardManyToOneDescriptor(_ForwardManyToOneDescriptor):
     def __get__(self, instance, cls=None):
         if instance is None:
@@ -68,7 +136,8 @@ class ForwardManyToOneDescriptor(_ForwardManyToOneDescriptor):
                     # if accessed from an async context to make behavior more consistent
                     return maybe_coroutine(super(ForwardManyToOneDescriptor, self).__get__, instance, cls=cls)
                 else:
-                    return async_using_db(super(ForwardManyToOneDescriptor, self).__get__)(instance, cls=cls)
+                    getter = partial(super(ForwardManyToOneDescriptor, self).__get__, cls=cls)
+                    return related_object_loader.load(event_loop, self.field, getter, instance)
             return super(ForwardManyToOneDescriptor, self).__get__(instance, cls=cls)
 
 
@@ -172,7 +241,7 @@ class ReverseOneToOneDescriptor(_ReverseOneToOneDescriptor):
                     # if accessed from an async context to make behavior more consistent
                     return maybe_coroutine(super(_ReverseOneToOneDescriptor, self).__get__, instance, cls=cls)
                 else:
-                    return async_using_db(super(_ReverseOneToOneDescriptor, self).__get__)(instance, cls=cls)
+                    return async_using_db.readonly(super(_ReverseOneToOneDescriptor, self).__get__)(instance, cls=cls)
             return super(_ReverseOneToOneDescriptor, self).__get__(instance, cls=cls)
 
 
@@ -192,7 +261,8 @@ class ForwardOneToOneDescriptor(_ForwardOneToOneDescriptor):
                     # if accessed from an async context to make behavior more consistent
                     return maybe_coroutine(super(_ForwardOneToOneDescriptor, self).__get__, instance, cls=cls)
                 else:
-                    return async_using_db(super(_ForwardOneToOneDescriptor, self).__get__)(instance, cls=cls)
+                    getter = partial(super(_ForwardOneToOneDescriptor, self).__get__, cls=cls)
+                    return related_object_loader.load(event_loop, self.field, getter, instance)
             return super(_ForwardOneToOneDescriptor, self).__get__(instance, cls=cls)
 
 
@@ -421,6 +491,9 @@ class LanguageField(CharField):
         return value.value
 
     def from_db_value(self, value, expression, connection):
+        if value is None:
+            # e.g. a LEFT OUTER JOIN of select_related didn't match a row
+            return None
         return Languages(value)
 
     def to_python(self, value: str) -> Languages:
@@ -0,0 +1,140 @@
+"""discord-hero: Discord Application Framework for humans
+
+:copyright: (c) 2019-2020 monospacedmagic et al.
+:license: Apache-2.0 OR MIT
+"""
+
+from collections import OrderedDict
+import os
+import threading
+import time
+
+from django.db.models import signals
+
+
+class IdentityMap:
+    """Keeps the model instances that Discord objects have been wrapped
+    in by :class:`hero.Database` so wrapping the same Discord object
+    again doesn't need to query the database.
+
+    Entries are evicted at most ``ttl`` seconds after they were stored,
+    or earlier when the map is full, least recently used first. Saving or
+    deleting an instance of a model that the map holds invalidates
+    its entry.
+
+    :param maxsize:
+        The maximum number of instances to keep. Defaults to the
+        value of the ``IDENTITY_MAP_SIZE`` environment variable or
+        ``10000``. ``0`` disables the identity map.
+    :type maxsize: Optional[int]
+    :param ttl:
+        How many seconds after being stored instances are kept,
+        whether they are used or not. Defaults to the value of
+        the ``IDENTITY_MAP_TTL`` environment variable or ``60``.
+    :type ttl: Optional[float]
+    """
+
+    def __init__(self, maxsize=None, ttl=None):
+        if maxsize is None:
+            maxsize = int(os.getenv('IDENTITY_MAP_SIZE', 10000))
+        if ttl is None:
+            ttl = float(os.getenv('IDENTITY_MAP_TTL', 60))
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        # (model, identity key) -> (instance, expiry time)
+        self._entries = OrderedDict()
+        # (model, identity key) -> generation the entry was last invalidated in
+        self._invalidations = OrderedDict()
+        # the newest generation of the invalidations that have been dropped
+        self._forgotten = 0
+        self._lock = threading.Lock()
+        self._models = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0
+
+    def watch(self, model):
+        """Makes saving or deleting instances of ``model``
+        invalidate their entries.
+        """
+        if model in self._models:
+            return
+        self._models.add(model)
+        # saves and deletes can happen on any database worker
+        dispatch_uid = f'hero_identity_map_{id(self)}'
+        signals.post_save.connect(self._on_post_save, sender=model, dispatch_uid=dispatch_uid)
+        signals.post_delete.connect(self._on_post_delete, sender=model, dispatch_uid=dispatch_uid)
+
+    def get(self, model, key):
+        """Returns the instance of ``model`` with the given identity
+        key or ``None`` if it isn't in the map or has expired.
+        """
+        with self._lock:
+            try:
+                obj, expires_at = self._entries[(model, key)]
+            except KeyError:
+                return None
+            if expires_at < time.monotonic():
+                del self._entries[(model, key)]
+                return None
+            self._entries.move_to_end((model, key))
+            return obj
+
+    def put(self, obj, generation=None):
+        """Adds a model instance to the map.
+
+        :param generation:
+            The :attr:`generation` of the map before ``obj`` was loaded.
+            If its entry has been invalidated since then, ``obj`` might
+            be outdated already and is not added.
+        :type generation: Optional[int]
+        """
+        if not self.enabled:
+            return
+        key = (type(obj), obj._identity_key)
+        with self._lock:
+            if generation is not None and (generation < self._forgotten
+                                           or self._invalidations.get(key, 0) > generation):
+                return
+            self._entries[key] = (obj, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, obj):
+        with self._lock:
+            self._invalidate((type(obj), obj._identity_key))
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._forgotten = self.generation
+            self._entries.clear()
+            self._invalidations.clear()
+
+    def _invalidate(self, key, keep=None):
+        # must be called with self._lock held
+        self.generation += 1
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] is not keep:
+            del self._entries[key]
+        self._invalidations[key] = self.generation
+        self._invalidations.move_to_end(key)
+        while len(self._invalidations) > max(self.maxsize, 1):
+            _, self._forgotten = self._invalidations.popitem(last=False)
+
+    def _on_post_save(self, sender, instance, created, **kwargs):
+        if created:
+            # there can't be an outdated instance of a row that didn't exist
+            return
+        with self._lock:
+            # keep the entry if the instance in the map is the one that has been saved
+            self._invalidate((sender, instance._identity_key), keep=instance)
+
+    def _on_post_delete(self, sender, instance, **kwargs):
+        self.invalidate(instance)
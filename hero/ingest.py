@@ -0,0 +1,182 @@
+"""Write-behind buffer for storing many messages
+
+discord-hero: Discord Application Framework for humans
+
+:copyright: (c) 2019-2020 monospacedmagic et al.
+:license: Apache-2.0 OR MIT
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+import discord
+
+from django.db import transaction
+
+from . import metrics
+from .errors import InactiveUser, UserDoesNotExist
+from .registration import Registration, registration_cache, user_registry
+from .utils import async_using_db
+
+
+logger = logging.getLogger('hero.db')
+
+MAX_FLUSH_ATTEMPTS = 3
+"""int: How many times in a row writing buffered messages may fail
+before they are dropped.
+"""
+
+
+@async_using_db
+def _write_messages(entries, bot_user_id):
+    from hero.models import Guild, TextChannel, User, Message
+
+    guild_ids = {guild_id for _, guild_id, _ in entries if guild_id is not None}
+    channels = {message.channel_id: guild_id for message, guild_id, _ in entries}
+    author_ids = {message.author_id for message, _, _ in entries}
+
+    with transaction.atomic():
+        # in dependency order
+        Guild.objects.bulk_create([Guild(id=guild_id) for guild_id in guild_ids], ignore_conflicts=True)
+        TextChannel.objects.bulk_create([TextChannel(id=channel_id, guild_id=guild_id, is_dm=guild_id is None)
+                                         for channel_id, guild_id in channels.items()], ignore_conflicts=True)
+        if bot_user_id in author_ids:
+            User.objects.bulk_create([User(id=bot_user_id)], ignore_conflicts=True)
+        # authors may have unregistered since their messages were buffered
+        active_ids = set(User.objects.filter(id__in=author_ids, is_active=True).values_list('id', flat=True))
+        messages = [message for message, _, _ in entries if message.author_id in active_ids]
+        Message.objects.bulk_create(messages, ignore_conflicts=True)
+    return len(messages)
+
+
+class MessageBuffer:
+    """Stores messages in the background in batches.
+
+    Messages added to the buffer are written to the database together
+    with their guilds and channels using bulk inserts in a single
+    transaction once ``max_size`` messages have been buffered or
+    ``interval`` seconds after the previous flush, whichever happens
+    first. The buffer is flushed when the :class:`hero.Core` is closed.
+    If writing fails, the messages are kept in the buffer and written
+    with the next flush, up to :data:`MAX_FLUSH_ATTEMPTS` times.
+
+    The time from adding a message to it being written is recorded in
+    the ``db.message_buffer.lag`` histogram (see :mod:`hero.metrics`).
+
+    Use :meth:`hero.Database.wrap_message` with ``buffered=True``
+    to add messages.
+
+    :param max_size:
+        Defaults to the value of the ``MESSAGE_BUFFER_SIZE``
+        environment variable or ``500``.
+    :type max_size: Optional[int]
+    :param interval:
+        Defaults to the value of the ``MESSAGE_BUFFER_INTERVAL``
+        environment variable or ``2`` seconds.
+    :type interval: Optional[float]
+    """
+
+    def __init__(self, core, max_size=None, interval=None):
+        if max_size is None:
+            max_size = int(os.getenv('MESSAGE_BUFFER_SIZE', 500))
+        if interval is None:
+            interval = float(os.getenv('MESSAGE_BUFFER_INTERVAL', 2))
+        self.core = core
+        self.max_size = max_size
+        self.interval = interval
+        self._entries = []
+        self._failures = 0
+        self._flush_task = None
+        self._closing = None
+        self._flushes = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, discord_message: discord.Message):
+        """Adds a message to the buffer and returns the (not yet saved)
+        :class:`hero.models.Message` it will be stored as.
+
+        :raises UserDoesNotExist:
+            The author of the message is known not to be registered.
+        :raises InactiveUser:
+            The author of the message is known to have unregistered.
+        """
+        from hero.models import Message
+
+        author = discord_message.author
+        is_self = self.core.user is not None and author.id == self.core.user.id
+        if author.bot and not is_self:
+            raise ValueError("Bot users cannot be stored in the database")
+        if user_registry.get(author.id) is Registration.INACTIVE:
+            raise InactiveUser(user_id=author.id)
+        # messages of users that aren't known to be registered are
+        # filtered out when they are written
+        if registration_cache.get(author.id) is Registration.UNREGISTERED and not is_self:
+            raise UserDoesNotExist(user_id=author.id)
+
+        message = Message(id=discord_message.id, channel_id=discord_message.channel.id, author_id=author.id)
+        message._discord_obj = discord_message
+        guild_id = discord_message.guild.id if discord_message.guild is not None else None
+        self._entries.append((message, guild_id, time.perf_counter()))
+
+        if self._flush_task is None:
+            self._closing = asyncio.Event()
+            self._flush_task = asyncio.ensure_future(self._flush_periodically())
+        if len(self._entries) >= self.max_size:
+            flush = asyncio.ensure_future(self.flush())
+            self._flushes.add(flush)
+            flush.add_done_callback(self._flushes.discard)
+        return message
+
+    async def flush(self):
+        """Writes all buffered messages to the database."""
+        entries, self._entries = self._entries, []
+        if not entries:
+            return
+        write = asyncio.ensure_future(_write_messages(entries, self.core.user.id
+                                                      if self.core.user is not None else None))
+        try:
+            # cancelling the flush mustn't cancel the write of the entries taken out of the buffer
+            await asyncio.shield(write)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._failures += 1
+            if self._failures >= MAX_FLUSH_ATTEMPTS:
+                self._failures = 0
+                logger.exception("Could not store %d buffered messages, dropping them", len(entries))
+            else:
+                logger.warning("Could not store %d buffered messages, retrying with the next flush",
+                               len(entries), exc_info=True)
+                self._entries[:0] = entries
+            return
+        self._failures = 0
+        now = time.perf_counter()
+        lag = metrics.get_histogram('db.message_buffer.lag')
+        for _, _, added_at in entries:
+            lag.observe(now - added_at)
+
+    async def _flush_periodically(self):
+        while not self._closing.is_set():
+            try:
+                await asyncio.wait_for(self._closing.wait(), self.interval)
+            except asyncio.TimeoutError:
+                await self.flush()
+
+    async def close(self):
+        """Stops flushing periodically and flushes the buffer until
+        it is empty or writing has failed :data:`MAX_FLUSH_ATTEMPTS`
+        times in a row.
+        """
+        if self._flush_task is not None:
+            self._closing.set()
+            # a flush that is in progress is completed, not cancelled
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+        while self._entries:
+            await self.flush()
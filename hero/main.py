@@ -45,7 +45,7 @@ def main(test, **kwargs):
     if os.getenv('CACHE_TYPE') != 'simple' and not os.getenv('CACHE_HOST'):
         os.environ['CACHE_HOST'] = prompt("Cache host", value_proc=str, default='localhost')
         os.environ['CACHE_PORT'] = prompt("Cache port", value_proc=str,
-                                          default='6379' if cache_type == 'redis' else None)
+                                          default='6379' if cache_type in ('redis', 'tiered') else None)
         os.environ['CACHE_PASSWORD'] = input("Cache password: ")
         os.environ['CACHE_DB'] = prompt("Cache number", value_proc=str, default='0')
 
@@ -0,0 +1,87 @@
+"""discord-hero: Discord Application Framework for humans
+
+:copyright: (c) 2019-2020 monospacedmagic et al.
+:license: Apache-2.0 OR MIT
+"""
+
+import bisect
+import threading
+
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+"""Tuple[float]: The default upper bounds of the buckets of a
+:class:`Histogram`, in seconds.
+"""
+
+
+class Histogram:
+    """Counts observed values in buckets.
+
+    Values may be observed from any thread.
+
+    :param buckets:
+        The sorted upper bounds of the buckets. Values greater
+        than the last bound are counted in an overflow bucket.
+    :type buckets: Optional[Tuple[float]]
+    """
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or DEFAULT_BUCKETS)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        """Estimates the ``q``-quantile as the upper bound of
+        the bucket it falls into.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def __repr__(self):
+        return (f'<Histogram count={self.count} mean={self.mean:.6f} '
+                f'p99={self.quantile(0.99):.6f} max={self.max:.6f}>')
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def get_histogram(name, buckets=None) -> Histogram:
+    """Returns the :class:`Histogram` with the given name,
+    creating it first if necessary.
+    """
+    try:
+        return _histograms[name]
+    except KeyError:
+        with _histograms_lock:
+            return _histograms.setdefault(name, Histogram(buckets))
+
+
+def get_histograms(prefix=''):
+    """Returns a dict of all histograms whose name starts with ``prefix``."""
+    return {name: histogram for name, histogram in list(_histograms.items())
+            if name.startswith(prefix)}
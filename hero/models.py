@@ -4,29 +4,39 @@
 :license: Apache-2.0 OR MIT
 """
 
+import functools
 import inspect
+import itertools
 
 import discord
 from discord.ext.commands import converter
 
 from django.conf import settings as django_settings
-from django.db import models as _models
-from django.db.models import Count, Max, Min, prefetch_related_objects, Q, Sum
-from django.db.models.fields.reverse_related import ForeignObjectRel
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections, IntegrityError, models as _models
+from django.db.models import Count, Max, Min, Prefetch, prefetch_related_objects, Q, signals, Sum
+from django.db.models.utils import resolve_callables
 
 import hero
 from hero import fields
+from .db import batchable
 from .errors import InactiveUser, UserDoesNotExist
+from .executor import get_executor
+from .routers import read_db
+from .native import try_native
+from .registration import update_registration, Registration, registration_cache, user_registry
 # temporary fix until Django's ORM is async
 from .utils import async_using_db, MockMember
 
 
 class QuerySet(_models.QuerySet):
-    @async_using_db
+    @try_native('get')
+    @async_using_db.readonly
     def async_get(self, *args, **kwargs):
         return super(QuerySet, self).get(*args, **kwargs)
     async_get.__doc__ = _models.QuerySet.get.__doc__
 
+    @batchable('create')
     @async_using_db
     def async_create(self, **kwargs):
         return super(QuerySet, self).create(**kwargs)
@@ -42,6 +52,109 @@ class QuerySet(_models.QuerySet):
         return super(QuerySet, self).update_or_create(*args, **kwargs)
     async_update_or_create.__doc__ = _models.QuerySet.update_or_create.__doc__
 
+    def get_or_insert(self, defaults=None, **kwargs):
+        """Like :meth:`get_or_create`, but creates the object using
+        ``INSERT ... ON CONFLICT DO NOTHING`` (``INSERT IGNORE`` on
+        MySQL) instead of a transaction, so concurrent calls return the
+        same row instead of raising :class:`IntegrityError`.
+
+        On PostgreSQL, looking up and inserting the row takes a single
+        statement. On SQLite and MySQL, the row is looked up first and
+        only inserted if it doesn't exist.
+
+        The lookup must cover the primary key or a unique constraint of
+        the model, otherwise (and on other databases) this falls back to
+        :meth:`get_or_create`.
+
+        Returns a tuple of ``(object, created)``.
+        """
+        self._for_write = True
+        db = self.db
+        connection = connections[db]
+        if connection.vendor not in ('postgresql', 'sqlite', 'mysql') or not self._is_unique_lookup(kwargs):
+            return self.get_or_create(defaults=defaults, **kwargs)
+
+        opts = self.model._meta
+        obj = self.model(**dict(resolve_callables(self._extract_model_params(defaults, **kwargs))))
+        insert_fields = [field for field in opts.concrete_fields
+                         if not (field is opts.auto_field and obj.pk is None)]
+        values = [field.get_db_prep_save(field.pre_save(obj, True), connection) for field in insert_fields]
+        qn = connection.ops.quote_name
+        table = qn(opts.db_table)
+        columns = ', '.join(qn(field.column) for field in insert_fields)
+        queryset = self.filter(**kwargs)[:1]
+
+        if connection.vendor == 'postgresql':
+            # the insert is skipped if the lookup finds the row; if a concurrent
+            # transaction inserts it first, neither part returns it
+            select_sql, select_params = queryset.query.get_compiler(using=db).as_sql()
+            placeholders = ', '.join(f'CAST(%s AS {field.cast_db_type(connection)})'
+                                     for field in insert_fields)
+            returning = ', '.join(qn(field.column) for field in opts.concrete_fields)
+            sql = (f'WITH existing AS ({select_sql}), '
+                   f'inserted AS (INSERT INTO {table} ({columns}) SELECT {placeholders} '
+                   f'WHERE NOT EXISTS (SELECT 1 FROM existing) ON CONFLICT DO NOTHING RETURNING {returning}) '
+                   f'SELECT *, false AS _inserted FROM existing UNION ALL SELECT *, true FROM inserted')
+            rows = list(self.model._default_manager.raw(sql, (*select_params, *values)).using(db))
+            if rows:
+                obj = rows[0]
+                created = obj.__dict__.pop('_inserted')
+                if created:
+                    signals.post_save.send(sender=self.model, instance=obj, created=True, raw=False,
+                                           using=db, update_fields=None)
+                return obj, created
+        else:
+            rows = list(queryset)
+            if rows:
+                return rows[0], False
+            placeholders = ', '.join(['%s'] * len(insert_fields))
+            pk_column = qn(opts.pk.column)
+            with connection.cursor() as cursor:
+                if connection.vendor == 'mysql':
+                    cursor.execute(f'INSERT IGNORE INTO {table} ({columns}) VALUES ({placeholders})', values)
+                    created = cursor.rowcount == 1
+                    pk = cursor.lastrowid
+                elif connection.Database.sqlite_version_info >= (3, 35):
+                    cursor.execute(f'INSERT INTO {table} ({columns}) VALUES ({placeholders}) '
+                                   f'ON CONFLICT DO NOTHING RETURNING {pk_column}', values)
+                    row = cursor.fetchone()
+                    created = row is not None
+                    pk = row[0] if created else None
+                else:
+                    cursor.execute(f'INSERT OR IGNORE INTO {table} ({columns}) VALUES ({placeholders})', values)
+                    created = cursor.rowcount == 1
+                    pk = cursor.lastrowid
+            if created:
+                if obj.pk is None:
+                    obj.pk = pk
+                obj._state.adding = False
+                obj._state.db = db
+                signals.post_save.send(sender=self.model, instance=obj, created=True, raw=False,
+                                       using=db, update_fields=None)
+                return obj, True
+
+        # the row has been inserted concurrently
+        rows = list(queryset)
+        if rows:
+            return rows[0], False
+        raise IntegrityError(f"A {self.model.__name__} conflicting with {kwargs} exists already")
+
+    @async_using_db
+    def async_get_or_insert(self, defaults=None, **kwargs):
+        return self.get_or_insert(defaults=defaults, **kwargs)
+    async_get_or_insert.__doc__ = get_or_insert.__doc__
+
+    def _is_unique_lookup(self, lookup):
+        opts = self.model._meta
+        try:
+            names = {opts.get_field(name).name for name in lookup}
+        except FieldDoesNotExist:
+            return False
+        unique_sets = [{field.name} for field in opts.concrete_fields if field.unique]
+        unique_sets.extend(set(fields) for fields in opts.unique_together)
+        unique_sets.extend(set(constraint.fields) for constraint in opts.total_unique_constraints)
+        return any(unique_set <= names for unique_set in unique_sets)
+
     @async_using_db
     def async_bulk_create(self, *args, **kwargs):
         return super(QuerySet, self).bulk_create(*args, **kwargs)
@@ -52,47 +165,51 @@ class QuerySet(_models.QuerySet):
         return super(QuerySet, self).bulk_update(*args, **kwargs)
     async_bulk_update.__doc__ = _models.QuerySet.bulk_update.__doc__
 
-    @async_using_db
+    @try_native('count')
+    @async_using_db.readonly
     def async_count(self):
         return super(QuerySet, self).count()
     async_count.__doc__ = _models.QuerySet.count.__doc__
 
-    @async_using_db
+    @async_using_db.readonly
     def async_in_bulk(self, *args, **kwargs):
         return super(QuerySet, self).in_bulk(*args, **kwargs)
     async_in_bulk.__doc__ = _models.QuerySet.in_bulk.__doc__
 
-    @async_using_db
+    @async_using_db.readonly
     def async_iterator(self, *args, **kwargs):
         return super(QuerySet, self).iterator(*args, **kwargs)
     async_iterator.__doc__ = _models.QuerySet.iterator.__doc__
 
-    @async_using_db
+    @async_using_db.readonly
     def async_latest(self, *args):
         return super(QuerySet, self).latest(*args)
     async_latest.__doc__ = _models.QuerySet.latest.__doc__
 
-    @async_using_db
+    @async_using_db.readonly
     def async_earliest(self, *args):
         return super(QuerySet, self).earliest(*args)
     async_earliest.__doc__ = _models.QuerySet.earliest.__doc__
 
-    @async_using_db
+    @try_native('first')
+    @async_using_db.readonly
     def async_first(self):
         return super(QuerySet, self).first()
     async_first.__doc__ = _models.QuerySet.first.__doc__
 
-    @async_using_db
+    @try_native('last')
+    @async_using_db.readonly
     def async_last(self):
         return super(QuerySet, self).last()
     async_last.__doc__ = _models.QuerySet.last.__doc__
 
-    @async_using_db
+    @async_using_db.readonly
     def async_aggregate(self, *args, **kwargs):
         return super(QuerySet, self).aggregate(*args, **kwargs)
     async_aggregate.__doc__ = _models.QuerySet.aggregate.__doc__
 
-    @async_using_db
+    @try_native('exists')
+    @async_using_db.readonly
     def async_exists(self):
         return super(QuerySet, self).exists()
     async_exists.__doc__ = _models.QuerySet.exists.__doc__
@@ -107,10 +224,43 @@ class QuerySet(_models.QuerySet):
         return super(QuerySet, self).delete()
     async_delete.__doc__ = _models.QuerySet.delete.__doc__
 
-    @async_using_db
+    @try_native('to_list')
+    @async_using_db.readonly
     def async_to_list(self):
         return list(self)
 
+    async def astream(self, chunk_size=2000):
+        """Asynchronously iterates over the results of the queryset without
+        loading all of them into memory at once.
+
+        The results are fetched ``chunk_size`` objects at a time by a
+        dedicated database worker, using a server-side cursor on PostgreSQL,
+        so only one chunk is held in memory at any time. At most
+        ``DB_MAX_STREAMS`` streams are open at the same time; further
+        streams wait for a free connection.
+
+        Example: ::
+
+            async for member in Member.objects.filter(guild=guild).astream():
+                ...
+        """
+        queryset = self.using(read_db(self))
+        # waits if too many streams are open since each needs a connection
+        worker = await get_executor().start_dedicated()
+        iterator = queryset.iterator(chunk_size=chunk_size)
+        try:
+            while True:
+                # the iterator and its cursor must stay on the same thread and connection
+                chunk = await worker.run(functools.partial(list, itertools.islice(iterator, chunk_size)),
+                                         name='QuerySet.astream', model=self.model)
+                if not chunk:
+                    break
+                for obj in chunk:
+                    yield obj
+        finally:
+            await worker.run(iterator.close, name='QuerySet.astream', model=self.model)
+            worker.close()
+
 
 class BaseManager(_models.manager.BaseManager):
     # Django's version doesn't support callables other than functions so we have to override this
@@ -163,6 +313,13 @@ class Model(_models.Model):
     _cached_core = None
     _is_loaded = False
 
+    load_depth = 1
+    """int: How many relations away :meth:`load` loads related objects."""
+    load_reverse_relations = True
+    """bool: Whether :meth:`load` prefetches the objects that relate
+    to an object, e.g. all messages of a user.
+    """
+
     @property
     def _core(self):
         """The :class:`Core`. Should only be accessed from within the
@@ -182,22 +339,114 @@ class Model(_models.Model):
     def is_loaded(self):
         return self._is_loaded
 
-    @async_using_db
-    def async_load(self, prefetch_related=True):
-        self.load(prefetch_related=prefetch_related)
-
-    def load(self, prefetch_related=True):
-        self.refresh_from_db()
-        if prefetch_related is not False:
-            if prefetch_related is True:
-                prefetch_related_objects((self,), *tuple((f.get_attname() + '_set' for f in self._meta.fields
-                                                          if isinstance(f, ForeignObjectRel))))
-            elif prefetch_related is None:
-                self.objects.prefetch_related((None,))
-            else:
-                self.objects.prefetch_related(prefetch_related)
-        self._is_loaded = True
+    @async_using_db.readonly
+    def async_load(self, prefetch_related=True, depth=None):
+        self.load(prefetch_related=prefetch_related, depth=depth)
+
+    def load(self, prefetch_related=True, depth=None):
+        """Reloads the object's fields from the database and loads its
+        related objects so accessing them later doesn't need a query.
+
+        :param prefetch_related:
+            ``True`` loads the objects the model relates to up to
+            ``depth`` relations away using ``select_related`` and, if
+            :attr:`load_reverse_relations` is set, the objects that relate
+            to it using ``prefetch_related``. ``None`` only loads the
+            former, ``False`` loads neither. A lookup or a list of lookups
+            is prefetched instead.
+        :type prefetch_related: Union[bool, None, str, Prefetch, List[Union[str, Prefetch]]]
+        :param depth:
+            Defaults to :attr:`load_depth`.
+        :type depth: Optional[int]
+        """
+        self._load_instances([self], prefetch_related=prefetch_related, depth=depth)
 
+    @classmethod
+    @async_using_db.readonly
+    def async_load_many(cls, instances, prefetch_related=True, depth=None):
+        return cls.load_many(instances, prefetch_related=prefetch_related, depth=depth)
+
+    @classmethod
+    def load_many(cls, instances, prefetch_related=True, depth=None):
+        """Like :meth:`load`, but loads many objects of this model
+        using one query plus one per relation that is prefetched.
+        Returns the objects as a list.
+        """
+        instances = list(instances)
+        cls._load_instances(instances, prefetch_related=prefetch_related, depth=depth)
+        return instances
+
+    @classmethod
+    def get_load_plan(cls, reverse=None, depth=None):
+        """Returns the lookups :meth:`load` passes to ``select_related``
+        and ``prefetch_related`` as a tuple of two lists.
+        """
+        if reverse is None:
+            reverse = cls.load_reverse_relations
+        if depth is None:
+            depth = cls.load_depth
+        select_related = []
+        prefetch_related = []
+
+        def add_forward_relations(model, prefix, depth):
+            if depth < 1:
+                return
+            for field in model._meta.concrete_fields:
+                if field.is_relation and (field.many_to_one or field.one_to_one):
+                    lookup = prefix + field.name
+                    select_related.append(lookup)
+                    add_forward_relations(field.related_model, lookup + '__', depth - 1)
+
+        add_forward_relations(cls, '', depth)
+        if reverse:
+            for relation in cls._meta.related_objects:
+                if relation.is_hidden():
+                    continue
+                if relation.one_to_one:
+                    select_related.append(relation.get_accessor_name())
+                else:
+                    prefetch_related.append(relation.get_accessor_name())
+            prefetch_related.extend(field.name for field in cls._meta.many_to_many)
+        return select_related, prefetch_related
+
+    @classmethod
+    def _load_instances(cls, instances, prefetch_related=True, depth=None):
+        if not instances:
+            return
+        if prefetch_related is True or prefetch_related is None:
+            select_related, lookups = cls.get_load_plan(reverse=prefetch_related is True, depth=depth)
+        elif prefetch_related is False:
+            select_related, lookups = [], []
+        else:
+            select_related = []
+            lookups = [prefetch_related] if isinstance(prefetch_related, (str, Prefetch)) else list(prefetch_related)
+
+        queryset = cls._base_manager.db_manager(instances[0]._state.db, hints={'instance': instances[0]})
+        rows = queryset.select_related(*select_related).in_bulk([obj.pk for obj in instances])
+        to_one_fields = [field for field in cls._meta.concrete_fields if field.is_relation] \
+            + [relation for relation in cls._meta.related_objects if relation.one_to_one]
+        for obj in instances:
+            try:
+                row = rows[obj.pk]
+            except KeyError:
+                raise cls.DoesNotExist(f"{cls.__name__} matching query does not exist.") from None
+            # like refresh_from_db, but keeps the related objects that have just been selected
+            for field in cls._meta.concrete_fields:
+                setattr(obj, field.attname, getattr(row, field.attname))
+            for field in to_one_fields:
+                if field.is_cached(row):
+                    field.set_cached_value(obj, field.get_cached_value(row))
+                elif field.is_cached(obj):
+                    field.delete_cached_value(obj)
+            obj.__dict__.pop('_prefetched_objects_cache', None)
+            obj._state.db = row._state.db
+            obj._state.adding = False
+        if lookups:
+            prefetch_related_objects(instances, *lookups)
+        for obj in instances:
+            obj._is_loaded = True
+
+    @batchable('save')
     @async_using_db
     def async_save(self, **kwargs):
         super().save(**kwargs)
@@ -209,12 +458,13 @@ class Model(_models.Model):
     def validate(self):
         self.full_clean()
 
+    @batchable('delete')
     @async_using_db
     def async_delete(self, keep_parents=False, **kwargs):
         super().delete(keep_parents=keep_parents, **kwargs)
 
     @classmethod
-    @async_using_db
+    @async_using_db.readonly
     def async_get(cls, **kwargs):
         return cls.objects.get(**kwargs)
 
@@ -223,6 +473,7 @@ class Model(_models.Model):
         return cls.objects.get(**kwargs)
 
     @classmethod
+    @batchable('create')
     @async_using_db
     def async_create(cls, **kwargs):
         return cls.objects.create(**kwargs)
@@ -263,6 +514,9 @@ class DiscordModel(Model):
     class Meta:
         abstract = True
 
+    # there can be millions of e.g. messages relating to a user or guild
+    load_reverse_relations = False
+
     _discord_obj = None
     _discord_cls = None
     _discord_converter_cls = None
@@ -280,7 +534,7 @@ class DiscordModel(Model):
             raise TypeError(f"discord_obj has to be a discord.{cls._discord_cls.__name__} "
                             f"but a {type(discord_obj).__name__} was passed")
         if create_if_new:
-            obj, created = cls.objects.get_or_create(id=discord_obj.id)
+            obj, created = cls.objects.get_or_insert(id=discord_obj.id)
         else:
             obj = cls.objects.get(id=discord_obj.id)
             created = False
@@ -288,6 +542,20 @@ class DiscordModel(Model):
             obj._discord_obj = discord_obj
         return obj, not created
 
+    @classmethod
+    def _get_identity_key(cls, discord_obj):
+        """Returns the key that instances wrapping ``discord_obj``
+        are kept under in the :class:`hero.identity.IdentityMap`.
+        """
+        return discord_obj.id
+
+    @property
+    def _identity_key(self):
+        return self.pk
+
+    def _attach_discord_obj(self, discord_obj):
+        self._discord_obj = discord_obj
+
     @classmethod
     async def convert(cls, ctx, argument):
         converter = cls._discord_converter_cls()
@@ -308,6 +576,7 @@ class DiscordModel(Model):
     def discord(self):
         return self._discord_obj
 
+    @batchable('delete')
     @async_using_db
     def async_delete(self, using=None, keep_parents=True):
         self.delete(using=using, keep_parents=keep_parents)
@@ -358,24 +627,72 @@ class User(DiscordModel):
         if not isinstance(discord_obj, (MockMember, discord.Object)):
             # if self
             if discord_obj.id == discord_obj._state.user.id:
-                obj, _ = cls.objects.get_or_create(id=discord_obj.id)
+                obj, _ = cls.objects.get_or_insert(id=discord_obj.id)
                 return obj, True
 
             if discord_obj.bot:
                 raise ValueError("Bot users cannot be stored in the database")
-        qs = cls.objects.filter(id=discord_obj.id)
-        existed_already = qs.exists()
-        if not existed_already:
+        obj = cls.lookup(discord_obj.id)
+        if obj is Registration.UNREGISTERED:
             raise UserDoesNotExist(user_id=discord_obj.id)
-        obj = qs.first()
-        if not obj.is_active:
+        if obj is Registration.INACTIVE:
             raise InactiveUser(user_id=discord_obj.id)
         if isinstance(discord_obj, discord.Member):
             discord_obj = discord_obj._user
         if not isinstance(discord_obj, (MockMember, discord.Object)):
             obj._discord_obj = discord_obj
-        return obj, existed_already
+        return obj, True
 
+    @classmethod
+    def lookup(cls, user_id):
+        """Looks up whether data may be stored for the user with the given
+        ID using at most one query.
+
+        Inactive users are rejected without querying the database once
+        the :class:`hero.registration.UserRegistry` has been loaded.
+        Outcomes are cached for a few seconds (see
+        :class:`hero.registration.RegistrationCache`).
+
+        :return:
+            The :class:`User` if the user is registered and active,
+            otherwise :attr:`Registration.UNREGISTERED` or
+            :attr:`Registration.INACTIVE`.
+        :rtype: Union[User, Registration]
+        """
+        status = user_registry.get(user_id)
+        if status is Registration.INACTIVE:
+            return status
+
+        attnames = [field.attname for field in cls._meta.concrete_fields]
+        outcome = registration_cache.get(user_id)
+        if isinstance(outcome, Registration):
+            return outcome
+        if outcome is not None:
+            db, values = outcome
+            return cls.from_db(db, attnames, values)
+
+        generation = registration_cache.generation
+        obj = next(iter(cls.objects.filter(id=user_id)[:1]), None)
+        if obj is None:
+            registration_cache.put(user_id, Registration.UNREGISTERED, generation)
+            return Registration.UNREGISTERED
+        if status is None and user_registry.loaded:
+            # e.g. registered through another process
+            user_registry.set(user_id, Registration.ACTIVE if obj.is_active else Registration.INACTIVE)
+        if not obj.is_active:
+            registration_cache.put(user_id, Registration.INACTIVE, generation)
+            return Registration.INACTIVE
+        # cache the row instead of the instance so callers never share an instance
+        registration_cache.put(user_id, (obj._state.db, tuple(getattr(obj, attname) for attname in attnames)),
+                               generation)
+        return obj
+
+    @classmethod
+    @async_using_db.readonly
+    def async_lookup(cls, user_id):
+        return cls.lookup(user_id)
+
+    @batchable('delete')
     @async_using_db
     def async_delete(self, using=None, keep_parents=False):
         self.delete(using=using, keep_parents=keep_parents)
@@ -387,16 +704,24 @@ class User(DiscordModel):
         new_user = User(id=_id, is_active=False)
         new_user.save()
 
-    @async_using_db
-    def async_load(self, prefetch_related=True):
-        self.load(prefetch_related=prefetch_related)
+    @async_using_db.readonly
+    def async_load(self, prefetch_related=True, depth=None):
+        self.load(prefetch_related=prefetch_related, depth=depth)
 
-    def load(self, prefetch_related=True):
-        super().load(prefetch_related=True)
+    def load(self, prefetch_related=True, depth=None):
+        super().load(prefetch_related=prefetch_related, depth=depth)
         if not self.is_active:
             raise InactiveUser(f"The user {self.id} is inactive")
 
-    @async_using_db
+    @classmethod
+    def load_many(cls, instances, prefetch_related=True, depth=None):
+        instances = super().load_many(instances, prefetch_related=prefetch_related, depth=depth)
+        for user in instances:
+            if not user.is_active:
+                raise InactiveUser(f"The user {user.id} is inactive")
+        return instances
+
+    @async_using_db.readonly
     def _get_register_message(self):
         # allows internals to bypass GDPR checks to make the GDPR functionality
         # itself work, e.g. to handle register reactions
@@ -413,6 +738,10 @@ class User(DiscordModel):
         return discord_user
 
 
+signals.post_save.connect(update_registration, sender=User)
+signals.post_delete.connect(update_registration, sender=User)
+
+
 class Guild(DiscordModel):
     id = fields.BigIntegerField(primary_key=True)
     home = fields.BooleanField(default=False)
@@ -490,14 +819,14 @@ class TextChannel(DiscordModel):
 
         if is_dm:
             if create_if_new:
-                obj, created = cls.objects.get_or_create(id=discord_obj.id, is_dm=True)
+                obj, created = cls.objects.get_or_insert(id=discord_obj.id, defaults={'is_dm': True})
             else:
                 obj = cls.objects.get(id=discord_obj.id)
                 created = False
         else:
             if create_if_new:
                 guild, _ = Guild.sync_from_discord_obj(discord_obj.guild)
-                obj, created = cls.objects.get_or_create(id=discord_obj.id, guild=guild, is_dm=False)
+                obj, created = cls.objects.get_or_insert(id=discord_obj.id, defaults={'guild': guild, 'is_dm': False})
             else:
                 obj = cls.objects.get(id=discord_obj.id)
                 # obj.guild._discord_obj = discord_obj.guild
@@ -541,7 +870,7 @@ class VoiceChannel(DiscordModel):
                             f"but a {type(discord_obj).__name__} was passed")
         if create_if_new:
             guild, _ = Guild.sync_from_discord_obj(discord_obj.guild, create_if_new=create_if_new)
-            obj, created = cls.objects.get_or_create(id=discord_obj.id, guild=guild)
+            obj, created = cls.objects.get_or_insert(id=discord_obj.id, defaults={'guild': guild})
         else:
             obj = cls.objects.get(id=discord_obj.id)
             # obj.guild._discord_obj = discord_obj.guild
@@ -575,7 +904,7 @@ class CategoryChannel(DiscordModel):
                             f"but a {type(discord_obj).__name__} was passed")
         if create_if_new:
             guild, _ = Guild.sync_from_discord_obj(discord_obj.guild, create_if_new=create_if_new)
-            obj, created = cls.objects.get_or_create(id=discord_obj.id, guild=guild)
+            obj, created = cls.objects.get_or_insert(id=discord_obj.id, defaults={'guild': guild})
         else:
             obj = cls.objects.get(id=discord_obj.id)
             # obj.guild._discord_obj = discord_obj.guild
@@ -609,7 +938,7 @@ class Role(DiscordModel):
                             f"but a {type(discord_obj).__name__} was passed")
         if create_if_new:
             guild, _ = Guild.sync_from_discord_obj(discord_obj.guild, create_if_new=create_if_new)
-            obj, created = cls.objects.get_or_create(id=discord_obj.id, guild=guild)
+            obj, created = cls.objects.get_or_insert(id=discord_obj.id, defaults={'guild': guild})
         else:
             obj = cls.objects.get(id=discord_obj.id)
             # obj.guild._discord_obj = discord_obj.guild
@@ -619,12 +948,9 @@ class Role(DiscordModel):
         return obj, not created
 
     async def fetch(self) -> discord.Role:
-        # if not self.guild.is_fetched:
-        #     await self.guild.fetch()
-        guild = await self.guild
-        await guild.fetch()
-        roles = await guild.fetch_roles()
-        discord_role = discord.utils.get(roles, id=self.id)
+        # self.guild_id would have to be awaited
+        snapshot = await self._core.guild_snapshots.get(self.__dict__['guild_id'])
+        discord_role = snapshot.roles.get(self.id)
         self._discord_obj = discord_role
         return discord_role
 
@@ -648,25 +974,53 @@ class Emoji(DiscordModel):
         if isinstance(discord_obj, discord.Emoji):
             discord_obj = discord.PartialEmoji(name=discord_obj.name, animated=discord_obj.animated, id=discord_obj.id)
         if discord_obj.is_custom_emoji():
-            obj, created = cls.objects.get_or_create(id=discord_obj.id, name=discord_obj.name,
-                                                     animated=discord_obj.animated, is_custom=True)
+            obj, created = cls.objects.get_or_insert(id=discord_obj.id, defaults={
+                'name': discord_obj.name, 'animated': discord_obj.animated, 'is_custom': True
+            })
         else:
-            obj, created = cls.objects.get_or_create(name=discord_obj.name, animated=False, is_custom=False)
+            obj, created = cls._get_or_create_unicode(discord_obj.name)
 
         obj._discord_obj = discord_obj
         return obj, not created
 
+    @classmethod
+    def _get_or_create_unicode(cls, name):
+        # unicode emoji rows never change, so they're kept in memory once they're known
+        attnames = [field.attname for field in cls._meta.concrete_fields]
+        row = _unicode_emoji_rows.get(name)
+        if row is not None:
+            db, values = row
+            return cls.from_db(db, attnames, values), False
+        obj, created = cls.objects.get_or_insert(name=name, animated=False, is_custom=False)
+        # cache the row instead of the instance so callers never share an instance
+        _unicode_emoji_rows[name] = (obj._state.db, tuple(getattr(obj, attname) for attname in attnames))
+        return obj, created
+
+    @classmethod
+    def _get_identity_key(cls, discord_obj):
+        # unicode emojis don't have an ID on Discord
+        return discord_obj.id if discord_obj.id is not None else discord_obj.name
+
+    @property
+    def _identity_key(self):
+        return self.id if self.is_custom else self.name
+
+    def _attach_discord_obj(self, discord_obj):
+        if isinstance(discord_obj, discord.Emoji):
+            discord_obj = discord.PartialEmoji(name=discord_obj.name, animated=discord_obj.animated, id=discord_obj.id)
+        self._discord_obj = discord_obj
+
     async def fetch(self) -> discord.PartialEmoji:
         if self.is_custom:
-            # if not self.guild.is_fetched:
-            #     await self.guild.fetch()
-            guild = await self.guild
-            await guild.fetch()
-            emoji = await guild.fetch_emoji(self.id)
-            discord_emoji = discord.PartialEmoji(name=emoji.name, animated=emoji.animated, id=emoji.id)
-            if self.name != emoji.name:
-                self.name = emoji.name
-                await self.async_save()
+            # emojis aren't stored with their guild, but the row has everything a PartialEmoji needs
+            emoji = self._core.get_emoji(self.id)
+            if emoji is None:
+                discord_emoji = discord.PartialEmoji(name=self.name, animated=self.animated, id=self.id)
+            else:
+                discord_emoji = discord.PartialEmoji(name=emoji.name, animated=emoji.animated, id=emoji.id)
+                if self.name != emoji.name:
+                    self.name = emoji.name
+                    await self.async_save()
         else:
             discord_emoji = discord.PartialEmoji(name=self.name)
         self._discord_obj = discord_emoji
@@ -674,6 +1028,18 @@ class Emoji(DiscordModel):
         return discord_emoji
 
 
+# name -> (database alias, field values)
+_unicode_emoji_rows = {}
+
+
+def _forget_unicode_emoji(sender, instance, **kwargs):
+    if not instance.is_custom:
+        _unicode_emoji_rows.pop(instance.name, None)
+
+
+signals.post_delete.connect(_forget_unicode_emoji, sender=Emoji)
+
+
 class Member(DiscordModel):
     class Meta:
         unique_together = (('user', 'guild'),)
@@ -698,20 +1064,42 @@ class Member(DiscordModel):
         if not isinstance(discord_obj, (discord.Member, MockMember)):
             raise TypeError(f"discord_obj has to be a discord.Member "
                             f"but a {type(discord_obj).__name__} was passed")
-        _user, _ = User.sync_from_discord_obj(discord_obj)
-        _guild, _ = Guild.sync_from_discord_obj(discord_obj.guild, create_if_new=create_if_new)
-        # workaround for the nonexistence of composite primary keys in Django
-        qs = cls.objects.filter(user=_user, guild=_guild)
-        if qs.exists():
-            obj = qs.first()
-            obj.load()
+        user_id, guild_id = discord_obj.id, discord_obj.guild.id
+        # the bot user doesn't have to register
+        if isinstance(discord_obj, MockMember) or user_id != discord_obj._state.user.id:
+            if user_registry.get(user_id) is Registration.INACTIVE:
+                raise InactiveUser(user_id=user_id)
+        # workaround for the nonexistence of composite primary keys in Django;
+        # uses the index of the (user, guild) unique constraint
+        obj = next(iter(cls.objects.select_related('user', 'guild')
+                        .filter(user_id=user_id, guild_id=guild_id)[:1]), None)
+        if obj is not None:
+            if not obj.user.is_active:
+                raise InactiveUser(user_id=user_id)
             existed_already = True
         elif create_if_new:
-            obj = cls.objects.create(user=_user, guild=_guild)
-            existed_already = False
+            # a member can only exist if its user does
+            _user, _ = User.sync_from_discord_obj(discord_obj)
+            _guild, _ = Guild.sync_from_discord_obj(discord_obj.guild)
+            obj, created = cls.objects.get_or_insert(user=_user, guild=_guild)
+            existed_already = not created
+        else:
+            raise cls.DoesNotExist(f"Member {user_id} of guild {guild_id} does not exist")
+        if isinstance(discord_obj, discord.Member):
+            obj.user._discord_obj = discord_obj._user
+            obj.guild._discord_obj = discord_obj.guild
         obj._discord_obj = discord_obj
         return obj, existed_already
 
+    @classmethod
+    def _get_identity_key(cls, discord_obj):
+        return discord_obj.id, discord_obj.guild.id
+
+    @property
+    def _identity_key(self):
+        # self.user_id and self.guild_id would have to be awaited in async code
+        return self.__dict__['user_id'], self.__dict__['guild_id']
+
     async def fetch(self) -> discord.Member:
         # if not self.guild.is_fetched:
         #     await self.guild.fetch()
@@ -720,7 +1108,7 @@ class Member(DiscordModel):
         user = await self.user
         discord_member = guild.get_member(user.id)
         if discord_member is None:
-            discord_member = await guild.fetch_member(user.id)
+            discord_member = await self._core.fetch_member(guild.discord, user.id)
         self._discord_obj = discord_member
         return discord_member
 
@@ -762,7 +1150,7 @@ class Message(DiscordModel):
             user = discord_obj.author
         author, _ = User.sync_from_discord_obj(user)
         if create_if_new:
-            obj, created = cls.objects.get_or_create(id=discord_obj.id, channel=channel, author=author)
+            obj, created = cls.objects.get_or_insert(id=discord_obj.id, defaults={'channel': channel, 'author': author})
         else:
             obj = cls.objects.get(id=discord_obj.id)
             created = False
@@ -776,7 +1164,7 @@ class Message(DiscordModel):
         #     await self.channel.fetch()
         channel = await self.channel
         await channel.fetch()
-        discord_message = await channel.fetch_message(self.id)
+        discord_message = await self._core.fetch_message(channel.discord, self.id)
         self._discord_obj = discord_message
         return discord_message
 
@@ -0,0 +1,341 @@
+"""Native asynchronous database drivers for simple queries
+
+Running a query through :func:`hero.async_using_db` means handing it
+over to a database worker thread and waiting for the result to be handed
+back. For simple queries, this thread handoff can take longer than the
+query itself. If the ``USE_NATIVE_DB_DRIVER`` environment variable is
+set, simple queries are compiled to SQL by Django and run on a native
+asynchronous driver instead (``aiosqlite`` for SQLite and ``asyncpg``
+for PostgreSQL). Queries that cannot be compiled or run that way fall
+back to the database worker threads.
+
+discord-hero: Discord Application Framework for humans
+
+:copyright: (c) 2019-2020 monospacedmagic et al.
+:license: Apache-2.0 OR MIT
+"""
+
+import asyncio
+import functools
+import os
+import re
+import sqlite3
+
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models.query import MAX_GET_RESULTS, ModelIterable
+
+
+_placeholder_pattern = re.compile(r'%([%s])')
+
+
+class NotCompilable(Exception):
+    """Raised if a query cannot be run by a native engine."""
+
+
+class NativeEngine:
+    """Runs read-only queries of a database on a native async driver.
+
+    :param alias:
+        The alias of the database in Django's ``DATABASES`` setting.
+    :type alias: str
+    """
+    errors = ()
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.settings = connections.databases[alias]
+        self.pool_size = int(os.getenv('DB_WORKERS', 4))
+
+    def placeholder(self, index):
+        raise NotImplementedError
+
+    def convert_query(self, sql):
+        counter = iter(range(1, sql.count('%s') + 1))
+
+        def replace(match):
+            if match.group(1) == '%':
+                return '%'
+            return self.placeholder(next(counter))
+
+        return _placeholder_pattern.sub(replace, sql)
+
+    async def fetch(self, sql, params):
+        """Runs the (already converted) query and returns all rows."""
+        raise NotImplementedError
+
+    async def close(self):
+        raise NotImplementedError
+
+    async def _run(self, sql, params):
+        try:
+            return await self.fetch(self.convert_query(sql), tuple(params))
+        except self.errors as error:
+            # let the worker threads run it to get Django's error handling
+            raise NotCompilable(str(error)) from error
+
+    @staticmethod
+    def _compile(queryset):
+        compiler = queryset.query.get_compiler(using=queryset.db)
+        try:
+            sql, params = compiler.as_sql()
+        except EmptyResultSet:
+            return compiler, None, ()
+        except Exception as error:
+            # e.g. a SynchronousOnlyOperation if compiling needs a connection
+            raise NotCompilable(str(error)) from error
+        return compiler, sql, params
+
+    def compile(self, queryset):
+        """Compiles a queryset that yields model instances.
+
+        :raises NotCompilable:
+            The queryset cannot be hydrated without Django's help.
+        """
+        query = queryset.query
+        if (queryset._iterable_class is not ModelIterable
+                or queryset._prefetch_related_lookups
+                or queryset._known_related_objects
+                or query.select_for_update
+                or query.combinator
+                or query.select_related
+                or query.annotation_select
+                or query.extra_select):
+            raise NotCompilable("queryset is too complex")
+        return self._compile(queryset)
+
+    async def to_list(self, queryset):
+        if queryset._result_cache is not None:
+            return list(queryset._result_cache)
+        compiler, sql, params = self.compile(queryset)
+        if sql is None:
+            return []
+        rows = await self._run(sql, params)
+
+        klass_info = compiler.klass_info
+        start, end = klass_info['select_fields'][0], klass_info['select_fields'][-1] + 1
+        attnames = [column[0].target.attname for column in compiler.select[start:end]]
+        model = klass_info['model']
+        return [model.from_db(queryset.db, attnames, row[start:end])
+                for row in compiler.results_iter(results=[rows])]
+
+    async def get(self, queryset, *args, **kwargs):
+        clone = queryset.filter(*args, **kwargs)
+        if clone.query.can_filter() and not clone.query.distinct_fields:
+            clone = clone.order_by()
+        clone.query.set_limits(high=MAX_GET_RESULTS)
+        objs = await self.to_list(clone)
+        if len(objs) == 1:
+            return objs[0]
+        model = queryset.model
+        if not objs:
+            raise model.DoesNotExist(f"{model._meta.object_name} matching query does not exist.")
+        raise model.MultipleObjectsReturned(f"get() returned more than one {model._meta.object_name} "
+                                            f"-- it returned {len(objs)}!")
+
+    async def first(self, queryset):
+        objs = await self.to_list((queryset if queryset.ordered else queryset.order_by('pk'))[:1])
+        return objs[0] if objs else None
+
+    async def last(self, queryset):
+        objs = await self.to_list((queryset.reverse() if queryset.ordered else queryset.order_by('-pk'))[:1])
+        return objs[0] if objs else None
+
+    async def exists(self, queryset):
+        if queryset._result_cache is not None:
+            return bool(queryset._result_cache)
+        if queryset.query.select_for_update or queryset.query.combinator:
+            raise NotCompilable("queryset is too complex")
+        try:
+            query = queryset.query.exists(using=queryset.db)
+        except TypeError:
+            # Django < 3.2
+            query = queryset.query.exists()
+        compiler = query.get_compiler(using=queryset.db)
+        try:
+            sql, params = compiler.as_sql()
+        except EmptyResultSet:
+            return False
+        except Exception as error:
+            raise NotCompilable(str(error)) from error
+        return bool(await self._run(sql, params))
+
+    async def count(self, queryset):
+        if queryset._result_cache is not None:
+            return len(queryset._result_cache)
+        if queryset.query.select_for_update or queryset.query.combinator:
+            raise NotCompilable("queryset is too complex")
+        clone = queryset.order_by() if queryset.query.can_filter() else queryset._chain()
+        clone.query.select_related = False
+        _, sql, params = self._compile(clone)
+        if sql is None:
+            return 0
+        rows = await self._run(f'SELECT COUNT(*) FROM ({sql}) subquery', params)
+        return rows[0][0]
+
+
+class SQLiteEngine(NativeEngine):
+    errors = (sqlite3.Error,)
+
+    def __init__(self, alias):
+        super().__init__(alias)
+        import aiosqlite
+        self._connect = aiosqlite.connect
+        self._connections = None
+        self._opened = 0
+
+    def placeholder(self, index):
+        return '?'
+
+    async def _acquire(self):
+        if self._connections is None:
+            self._connections = asyncio.Queue()
+        if self._connections.empty() and self._opened < self.pool_size:
+            self._opened += 1
+            connection = None
+        else:
+            connection = await self._connections.get()
+        if connection is not None:
+            return connection
+        # the slot is reserved; a None in the queue stands for a slot
+        # whose connection was closed and has to be opened again
+        try:
+            return await self._open()
+        except BaseException:
+            self._connections.put_nowait(None)
+            raise
+
+    async def _open(self):
+        # use the same type detection as Django so its converters apply
+        connection = await self._connect(self.settings['NAME'],
+                                         detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+        try:
+            if os.getenv('USE_SQLITE_TUNING'):
+                from .sqlite import get_pragmas
+                for pragma in get_pragmas():
+                    await connection.execute(pragma)
+        except BaseException:
+            await connection.close()
+            raise
+        return connection
+
+    async def fetch(self, sql, params):
+        connection = await self._acquire()
+        try:
+            async with connection.execute(sql, params) as cursor:
+                rows = await cursor.fetchall()
+        except sqlite3.OperationalError:
+            # the connection may be unusable; open a new one next time
+            self._connections.put_nowait(None)
+            await connection.close()
+            raise
+        except BaseException:
+            self._connections.put_nowait(connection)
+            raise
+        self._connections.put_nowait(connection)
+        return rows
+
+    async def close(self):
+        if self._connections is None:
+            return
+        while not self._connections.empty():
+            connection = self._connections.get_nowait()
+            if connection is not None:
+                await connection.close()
+        self._connections = None
+        self._opened = 0
+
+
+class PostgresEngine(NativeEngine):
+    def __init__(self, alias):
+        super().__init__(alias)
+        import asyncpg
+        self._create_pool = asyncpg.create_pool
+        self.errors = (asyncpg.PostgresError, asyncpg.InterfaceError)
+        self._pool = None
+
+    def placeholder(self, index):
+        return f'${index}'
+
+    async def fetch(self, sql, params):
+        if self._pool is None:
+            self._pool = asyncio.ensure_future(self._create_pool(host=self.settings['HOST'] or None,
+                                                                 port=self.settings['PORT'] or None,
+                                                                 user=self.settings['USER'],
+                                                                 password=self.settings['PASSWORD'],
+                                                                 database=self.settings['NAME'],
+                                                                 min_size=1, max_size=self.pool_size))
+        pool = await self._pool
+        async with pool.acquire() as connection:
+            return [tuple(record) for record in await connection.fetch(sql, *params)]
+
+    async def close(self):
+        if self._pool is not None:
+            pool, self._pool = await self._pool, None
+            await pool.close()
+
+
+_engine_classes = {
+    'sqlite': SQLiteEngine,
+    'postgresql': PostgresEngine,
+}
+
+_engines = {}
+
+
+def get_engine(alias='default'):
+    """Returns the native engine for the given database alias or ``None``
+    if native drivers are disabled or not available for its backend.
+    """
+    if not os.getenv('USE_NATIVE_DB_DRIVER'):
+        return None
+    try:
+        return _engines[alias]
+    except KeyError:
+        pass
+    engine_cls = _engine_classes.get(connections[alias].vendor)
+    try:
+        engine = engine_cls(alias) if engine_cls is not None else None
+    except ImportError:
+        engine = None
+    _engines[alias] = engine
+    return engine
+
+
+async def close_engines():
+    engines = [engine for engine in _engines.values() if engine is not None]
+    _engines.clear()
+    for engine in engines:
+        await engine.close()
+
+
+def try_native(operation):
+    """Decorator for :class:`hero.models.QuerySet` methods decorated with
+    :func:`hero.async_using_db` that tries to run them on a native engine
+    first.
+
+    :param operation:
+        The name of the :class:`NativeEngine` method that implements
+        the decorated method.
+    :type operation: str
+    """
+    def decorator(fallback):
+        @functools.wraps(fallback.func)
+        async def wrapped(queryset, *args, **kwargs):
+            from .routers import read_db
+
+            alias = read_db(queryset)
+            if alias != queryset.db:
+                queryset = queryset.using(alias)
+            engine = get_engine(alias)
+            if engine is not None:
+                try:
+                    return await getattr(engine, operation)(queryset, *args, **kwargs)
+                except NotCompilable:
+                    pass
+            return await fallback(queryset, *args, **kwargs)
+
+        wrapped.sync = fallback.sync
+        return wrapped
+
+    return decorator
@@ -0,0 +1,248 @@
+"""Synchronizes guilds, channels, roles and members with the database
+
+If NumPy is installed (``pip install discord-hero[numpy]``), the member
+IDs of large guilds are compared as sorted NumPy arrays, which is faster
+and takes a fraction of the memory of Python sets.
+
+discord-hero: Discord Application Framework for humans
+
+:copyright: (c) 2019-2020 monospacedmagic et al.
+:license: Apache-2.0 OR MIT
+"""
+
+import asyncio
+import logging
+import os
+
+import discord
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .registration import Registration, user_registry
+from .utils import async_using_db
+
+
+logger = logging.getLogger('hero.db')
+
+DELETE_CHUNK_SIZE = 500
+"""int: The maximum number of rows deleted by a single query."""
+
+MEMBER_BATCH_SIZE = 5000
+"""int: The maximum number of members inserted
+by a single database operation while reconciling members.
+"""
+
+
+def take_snapshot(guild: discord.Guild):
+    """Returns the IDs of the channels and roles of a guild
+    by the model they are stored as.
+    """
+    from hero.models import TextChannel, VoiceChannel, CategoryChannel, Role
+
+    return {
+        TextChannel: {channel.id for channel in guild.text_channels},
+        VoiceChannel: {channel.id for channel in guild.voice_channels},
+        CategoryChannel: {category.id for category in guild.categories},
+        Role: {role.id for role in guild.roles},
+    }
+
+
+@async_using_db
+def _create_guild(guild_id):
+    from hero.models import Guild
+
+    Guild.objects.bulk_create([Guild(id=guild_id)], ignore_conflicts=True)
+
+
+@async_using_db
+def _get_stored_ids(model, guild_id):
+    return set(model.objects.filter(guild_id=guild_id).values_list('id', flat=True))
+
+
+@async_using_db
+def _create_rows(model, objs):
+    model.objects.bulk_create(objs, ignore_conflicts=True)
+
+
+@async_using_db
+def _delete_rows(model, **lookups):
+    # deleting through the ORM cascades and notifies the identity map
+    model.objects.filter(**lookups).delete()
+
+
+async def _apply_snapshot(guild_id, snapshot):
+    # every query is a database operation of its own so
+    # commands don't have to wait for the whole guild
+    created = deleted = 0
+    await _create_guild(guild_id)
+    for model, live_ids in snapshot.items():
+        stored_ids = await _get_stored_ids(model, guild_id)
+        missing = [model(id=_id, guild_id=guild_id) for _id in live_ids - stored_ids]
+        if missing:
+            await _create_rows(model, missing)
+        created += len(missing)
+        stale = sorted(stored_ids - live_ids)
+        for index in range(0, len(stale), DELETE_CHUNK_SIZE):
+            await _delete_rows(model, guild_id=guild_id, id__in=stale[index:index + DELETE_CHUNK_SIZE])
+        deleted += len(stale)
+    return created, deleted
+
+
+def _diff_member_ids(live_ids, stored_ids, active_ids):
+    """Returns the sorted IDs of the members that have to be inserted
+    and deleted and whether the IDs to insert have been limited to
+    active users. ``active_ids`` is the sorted snapshot of the IDs of
+    the active users the NumPy diff uses or ``None``.
+    """
+    if numpy is not None:
+        live = numpy.unique(numpy.fromiter(live_ids, dtype=numpy.uint64))
+        stored = numpy.fromiter(stored_ids, dtype=numpy.uint64)
+        # unique per guild because of the (user, guild) unique constraint
+        stored.sort()
+        missing = numpy.setdiff1d(live, stored, assume_unique=True)
+        if active_ids is not None:
+            missing = numpy.intersect1d(missing, numpy.frombuffer(active_ids, dtype=numpy.uint64),
+                                        assume_unique=True)
+        stale = numpy.setdiff1d(stored, live, assume_unique=True)
+        return missing.tolist(), stale.tolist(), active_ids is not None
+    live = set(live_ids)
+    stored = set(stored_ids)
+    missing = sorted(live - stored)
+    filtered = user_registry.loaded
+    if filtered:
+        missing = [user_id for user_id in missing if user_registry.get(user_id) is Registration.ACTIVE]
+    return missing, sorted(stored - live), filtered
+
+
+@async_using_db
+def _diff_members(guild_id, live_ids, active_ids):
+    from hero.models import Member
+
+    stored_ids = (Member.objects.filter(guild_id=guild_id).values_list('user_id', flat=True)
+                  .iterator(chunk_size=MEMBER_BATCH_SIZE))
+    return _diff_member_ids(live_ids, stored_ids, active_ids)
+
+
+@async_using_db
+def _create_members(guild_id, user_ids, check_active):
+    from hero.models import Member, User
+
+    if check_active:
+        # only registered and active users may be stored
+        user_ids = list(User.objects.filter(id__in=user_ids, is_active=True).values_list('id', flat=True))
+    Member.objects.bulk_create([Member(user_id=user_id, guild_id=guild_id) for user_id in user_ids],
+                               ignore_conflicts=True)
+    return len(user_ids)
+
+
+async def _apply_member_ids(guild_id, live_ids, active_ids=None):
+    from hero.models import Member
+
+    await _create_guild(guild_id)
+    missing, stale, filtered = await _diff_members(guild_id, live_ids, active_ids)
+
+    created = 0
+    # one database operation per batch so commands don't have to wait for all of them
+    for index in range(0, len(missing), MEMBER_BATCH_SIZE):
+        created += await _create_members(guild_id, missing[index:index + MEMBER_BATCH_SIZE],
+                                         not filtered)
+    for index in range(0, len(stale), DELETE_CHUNK_SIZE):
+        await _delete_rows(Member, guild_id=guild_id, user_id__in=stale[index:index + DELETE_CHUNK_SIZE])
+    return created, len(stale)
+
+
+class Reconciler:
+    """Makes sure the database has a row for every guild, channel,
+    role and member the bot can see and none for those that have been
+    deleted.
+
+    The :class:`hero.Core` reconciles all guilds and guilds it joins
+    including their members, and guilds whose channels or roles are
+    created or deleted. Reconciling a guild compares the IDs in
+    discord.py's cache with those in the database and inserts and
+    deletes the differences in bulk.
+
+    :param concurrency:
+        How many guilds are reconciled at the same time so the other
+        database workers stay free for commands. Defaults to the value
+        of the ``RECONCILE_CONCURRENCY`` environment variable or ``2``.
+    :type concurrency: Optional[int]
+    """
+
+    def __init__(self, concurrency=None):
+        if concurrency is None:
+            concurrency = int(os.getenv('RECONCILE_CONCURRENCY', 2))
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.concurrency = concurrency
+        self._semaphore = None
+        # guilds waiting for their turn; their snapshot hasn't been taken yet
+        self._pending = set()
+        self._tasks = set()
+
+    async def reconcile(self, guild: discord.Guild, members=False):
+        """Reconciles a guild unless it is unavailable.
+
+        :param members:
+            Whether to reconcile the members of the guild as well.
+            Only members of guilds whose members have all been received
+            from Discord (see :attr:`discord.Guild.chunked`) are reconciled.
+            Only registered and active users are stored as members.
+        :type members: bool
+        :return: How many rows have been created and deleted.
+        :rtype: Tuple[int, int]
+        """
+        if guild.unavailable:
+            self._pending.discard((guild.id, members))
+            return 0, 0
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            self._pending.discard((guild.id, members))
+            # taken as late as possible so it includes all changes up to now
+            snapshot = take_snapshot(guild)
+            created, deleted = await _apply_snapshot(guild.id, snapshot)
+            if members and guild.chunked:
+                member_ids = [member.id for member in guild.members]
+                # shared by all guilds reconciled until the registry changes
+                active_ids = user_registry.get_active() if numpy is not None else None
+                created_members, deleted_members = await _apply_member_ids(guild.id, member_ids, active_ids)
+                created += created_members
+                deleted += deleted_members
+            return created, deleted
+
+    def schedule(self, guild: discord.Guild, members=False):
+        """Reconciles a guild in the background. Does nothing if
+        the guild is already waiting to be reconciled.
+        """
+        if (guild.id, members) in self._pending:
+            return
+        self._pending.add((guild.id, members))
+        task = asyncio.ensure_future(self._reconcile_logged(guild, members))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def schedule_all(self, guilds, members=False):
+        for guild in guilds:
+            self.schedule(guild, members=members)
+
+    async def _reconcile_logged(self, guild, members):
+        try:
+            created, deleted = await self.reconcile(guild, members=members)
+        except Exception:
+            self._pending.discard((guild.id, members))
+            logger.exception("Could not reconcile guild %d", guild.id)
+        else:
+            if created or deleted:
+                logger.debug("Reconciled guild %d: %d rows created, %d deleted", guild.id, created, deleted)
+
+    async def close(self):
+        """Cancels all scheduled reconciliations."""
+        for task in self._tasks:
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._pending.clear()
@@ -0,0 +1,214 @@
+"""discord-hero: Discord Application Framework for humans
+
+:copyright: (c) 2019-2020 monospacedmagic et al.
+:license: Apache-2.0 OR MIT
+"""
+
+from array import array
+import bisect
+from collections import OrderedDict
+import enum
+import os
+import threading
+import time
+
+from django.db.models import signals
+
+
+class Registration(enum.Enum):
+    """The registration status of a user (see :meth:`hero.models.User.lookup`
+    and :meth:`UserRegistry.get`).
+    """
+    ACTIVE = 'active'
+    UNREGISTERED = 'unregistered'
+    INACTIVE = 'inactive'
+
+
+class RegistrationCache:
+    """Remembers the outcomes of :meth:`hero.models.User.lookup` for a
+    few seconds. Entries are invalidated whenever a user is saved or
+    deleted.
+
+    :param ttl:
+        How many seconds outcomes are kept. Defaults to the value of
+        the ``REGISTRATION_CACHE_TTL`` environment variable or ``10``.
+        ``0`` disables the cache.
+    :type ttl: Optional[float]
+    :param maxsize:
+        The maximum number of outcomes to keep.
+    :type maxsize: int
+    """
+
+    def __init__(self, ttl=None, maxsize=10000):
+        if ttl is None:
+            ttl = float(os.getenv('REGISTRATION_CACHE_TTL', 10))
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.generation = 0
+        # user ID -> (outcome, expiry time)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """Returns the cached outcome for the given user ID or ``None``."""
+        with self._lock:
+            try:
+                outcome, expires_at = self._entries[user_id]
+            except KeyError:
+                return None
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            return outcome
+
+    def put(self, user_id, outcome, generation):
+        """Caches an outcome unless any user has been saved or deleted
+        since :attr:`generation` was ``generation``.
+        """
+        if not self.ttl:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[user_id] = (outcome, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self.generation += 1
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+
+class UserRegistry:
+    """Knows the IDs of all active and inactive users so the registration
+    status of a user can be checked without querying the database.
+
+    The IDs are kept in two sorted arrays of unsigned 64 bit integers,
+    which takes 8 bytes per user, and are looked up using binary search.
+    The registry is loaded by the :class:`hero.Core` when it starts and
+    kept up to date whenever a user is saved or deleted in this process
+    or looked up with :meth:`hero.models.User.lookup`. Users that
+    registered through another process aren't in it, so an ID the
+    registry doesn't know has to be looked up in the database.
+    """
+
+    def __init__(self):
+        self._active = array('Q')
+        self._inactive = array('Q')
+        self._lock = threading.Lock()
+        self._changes = None
+        self._active_snapshot = None
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._active) + len(self._inactive)
+
+    @staticmethod
+    def _contains(ids, user_id):
+        index = bisect.bisect_left(ids, user_id)
+        return index < len(ids) and ids[index] == user_id
+
+    @staticmethod
+    def _add(ids, user_id):
+        index = bisect.bisect_left(ids, user_id)
+        if index == len(ids) or ids[index] != user_id:
+            ids.insert(index, user_id)
+
+    @staticmethod
+    def _remove(ids, user_id):
+        index = bisect.bisect_left(ids, user_id)
+        if index < len(ids) and ids[index] == user_id:
+            del ids[index]
+
+    def get(self, user_id):
+        """Returns :attr:`Registration.ACTIVE` or :attr:`Registration.INACTIVE`
+        for known user IDs or ``None`` if the user ID is unknown or the
+        registry hasn't been loaded yet.
+        """
+        if not self.loaded:
+            return None
+        if self._contains(self._active, user_id):
+            return Registration.ACTIVE
+        if self._contains(self._inactive, user_id):
+            return Registration.INACTIVE
+        return None
+
+    def get_active(self):
+        """Returns a sorted copy of the IDs of all active users as
+        an ``array('Q')`` or ``None`` if the registry hasn't been
+        loaded yet. The same copy is returned until the registry
+        changes, so it must not be modified.
+        """
+        if not self.loaded:
+            return None
+        with self._lock:
+            if self._active_snapshot is None:
+                self._active_snapshot = array('Q', self._active)
+            return self._active_snapshot
+
+    def set(self, user_id, status):
+        """Updates the status of the given user ID."""
+        with self._lock:
+            if self._changes is not None:
+                # replayed once loading is done
+                self._changes.append((user_id, status))
+            self._active_snapshot = None
+            if status is Registration.ACTIVE:
+                self._remove(self._inactive, user_id)
+                self._add(self._active, user_id)
+            elif status is Registration.INACTIVE:
+                self._remove(self._active, user_id)
+                self._add(self._inactive, user_id)
+            else:
+                self._remove(self._active, user_id)
+                self._remove(self._inactive, user_id)
+
+    def load(self):
+        """Loads all user IDs from the database. Must be run by
+        a database worker.
+        """
+        from .models import User
+
+        with self._lock:
+            self._changes = []
+        try:
+            ids = {}
+            for is_active in (True, False):
+                ids[is_active] = array('Q', User.objects.filter(is_active=is_active).order_by('id')
+                                                       .values_list('id', flat=True).iterator())
+        except BaseException:
+            with self._lock:
+                self._changes = None
+            raise
+        with self._lock:
+            self._active, self._inactive = ids[True], ids[False]
+            self._active_snapshot = None
+            changes, self._changes = self._changes, None
+            self.loaded = True
+        for user_id, status in changes:
+            self.set(user_id, status)
+
+
+registration_cache = RegistrationCache()
+
+user_registry = UserRegistry()
+"""The :class:`UserRegistry` of the process."""
+
+
+def update_registration(sender, instance, **kwargs):
+    """Receiver of the ``post_save`` and ``post_delete`` signals of
+    :class:`hero.models.User` that keeps the :data:`registration_cache`
+    and the :data:`user_registry` up to date.
+    """
+    registration_cache.invalidate(instance.pk)
+    if kwargs.get('signal') is signals.post_delete:
+        user_registry.set(instance.pk, Registration.UNREGISTERED)
+    else:
+        user_registry.set(instance.pk, Registration.ACTIVE if instance.is_active else Registration.INACTIVE)
@@ -0,0 +1,149 @@
+"""discord-hero: Discord Application Framework for humans
+
+:copyright: (c) 2019-2020 monospacedmagic et al.
+:license: Apache-2.0 OR MIT
+"""
+
+import asyncio
+from collections import namedtuple, OrderedDict
+import os
+import time
+
+import discord
+
+
+class RestFetcher:
+    """Deduplicates requests to Discord's REST API that fetch objects
+    which aren't in discord.py's cache.
+
+    Concurrent fetches of the same object share a single request.
+    If an object couldn't be fetched because it doesn't exist or the
+    bot isn't allowed to see it, the error is remembered for a few
+    seconds and raised again without making another request.
+
+    :param negative_ttl:
+        How many seconds :class:`discord.NotFound` and
+        :class:`discord.Forbidden` errors are remembered. Defaults to
+        the value of the ``REST_NEGATIVE_CACHE_TTL`` environment
+        variable or ``30``. ``0`` disables remembering errors.
+    :type negative_ttl: Optional[float]
+    :param maxsize:
+        The maximum number of errors to remember.
+    :type maxsize: int
+    """
+
+    def __init__(self, negative_ttl=None, maxsize=10000):
+        if negative_ttl is None:
+            negative_ttl = float(os.getenv('REST_NEGATIVE_CACHE_TTL', 30))
+        self.negative_ttl = negative_ttl
+        self.maxsize = maxsize
+        # key -> task making the request
+        self._requests = {}
+        # key -> (error, expiry time)
+        self._errors = OrderedDict()
+
+    async def fetch(self, key, fetch_func, *args):
+        """Returns the result of ``await fetch_func(*args)``, sharing it
+        with all concurrent calls that use the same key.
+
+        :param key: Identifies the fetched object, e.g. ``('user', 1234)``.
+        :type key: Hashable
+        """
+        error = self._get_error(key)
+        if error is not None:
+            # drop the traceback of the previous raise, otherwise
+            # it would grow every time the error is raised again
+            raise error.with_traceback(None)
+        request = self._requests.get(key)
+        if request is None:
+            request = self._requests[key] = asyncio.ensure_future(self._request(key, fetch_func, *args))
+            request.add_done_callback(lambda _: self._requests.pop(key, None))
+        # a caller being cancelled mustn't cancel the request for the others
+        return await asyncio.shield(request)
+
+    async def _request(self, key, fetch_func, *args):
+        try:
+            return await fetch_func(*args)
+        except (discord.NotFound, discord.Forbidden) as error:
+            if self.negative_ttl:
+                self._errors[key] = (error, time.monotonic() + self.negative_ttl)
+                self._errors.move_to_end(key)
+                while len(self._errors) > self.maxsize:
+                    self._errors.popitem(last=False)
+            raise
+
+    def _get_error(self, key):
+        try:
+            error, expires_at = self._errors[key]
+        except KeyError:
+            return None
+        if expires_at < time.monotonic():
+            del self._errors[key]
+            return None
+        return error
+
+    def forget(self, key):
+        """Forgets the error remembered for the given key, e.g. because
+        the object has been created or the bot has been given access.
+        """
+        self._errors.pop(key, None)
+
+    def clear(self):
+        self._errors.clear()
+
+
+GuildSnapshot = namedtuple('GuildSnapshot', 'roles emojis')
+"""The roles and emojis of a guild by their IDs."""
+
+
+class GuildSnapshotCache:
+    """Provides the roles and emojis of guilds for :meth:`hero.models.Role.fetch`
+    and similar lookups.
+
+    For guilds in discord.py's cache, the cached roles and emojis are
+    used. Other guilds are fetched from the API once and their roles and
+    emojis are kept for ``ttl`` seconds or until one of them changes.
+
+    :param ttl:
+        Defaults to the value of the ``GUILD_SNAPSHOT_TTL``
+        environment variable or ``300``.
+    :type ttl: Optional[float]
+    """
+
+    def __init__(self, core, ttl=None):
+        if ttl is None:
+            ttl = float(os.getenv('GUILD_SNAPSHOT_TTL', 300))
+        self.core = core
+        self.ttl = ttl
+        # guild ID -> (snapshot, expiry time)
+        self._snapshots = {}
+
+    @staticmethod
+    def take(guild: discord.Guild):
+        return GuildSnapshot(roles={role.id: role for role in guild.roles},
+                             emojis={emoji.id: emoji for emoji in guild.emojis})
+
+    async def get(self, guild_id) -> GuildSnapshot:
+        guild = self.core.get_guild(guild_id)
+        if guild is not None:
+            # always up to date
+            return self.take(guild)
+        try:
+            snapshot, expires_at = self._snapshots[guild_id]
+        except KeyError:
+            pass
+        else:
+            if expires_at >= time.monotonic():
+                return snapshot
+        # guilds fetched from the API come with their roles and emojis
+        guild = await self.core.fetch_guild(guild_id)
+        snapshot = self.take(guild)
+        if self.ttl:
+            self._snapshots[guild_id] = (snapshot, time.monotonic() + self.ttl)
+        return snapshot
+
+    def invalidate(self, guild_id):
+        self._snapshots.pop(guild_id, None)
+
+    def clear(self):
+        self._snapshots.clear()
@@ -0,0 +1,84 @@
+"""Database routers
+
+If read replicas are configured using the ``DB_REPLICA_HOSTS`` environment
+variable, :class:`ReplicaRouter` sends the queries of read-only async methods
+(e.g. :meth:`hero.models.QuerySet.async_get` or awaited foreign keys) to a
+random replica and everything else to the primary (``default``) database.
+
+Once a command or event listener has written to the database, all of its
+following reads go to the primary as well so it always reads its own writes.
+
+discord-hero: Discord Application Framework for humans
+
+:copyright: (c) 2019-2020 monospacedmagic et al.
+:license: Apache-2.0 OR MIT
+"""
+
+import contextvars
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+reading = contextvars.ContextVar('hero_reading', default=False)
+"""Whether the code that is currently being run only reads from the
+database. Set by :func:`hero.async_using_db.readonly`.
+"""
+
+current_invocation = contextvars.ContextVar('hero_current_invocation', default=None)
+"""The :class:`Invocation` of the command or event listener that is
+currently being run. Set by the :class:`hero.Core`.
+"""
+
+
+class Invocation:
+    """Tracks whether a command or event listener has written to the
+    database yet. Shared by all of the database operations it runs.
+    """
+    __slots__ = ('wrote',)
+
+    def __init__(self):
+        self.wrote = False
+
+
+def get_replicas():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica_')]
+
+
+def read_db(queryset):
+    """Returns the alias of the database that a read-only operation
+    on ``queryset`` should be run on.
+    """
+    token = reading.set(True)
+    try:
+        return queryset.db
+    finally:
+        reading.reset(token)
+
+
+class ReplicaRouter:
+    def __init__(self):
+        self.replicas = get_replicas()
+
+    def db_for_read(self, model, **hints):
+        if not self.replicas or not reading.get():
+            return DEFAULT_DB_ALIAS
+        invocation = current_invocation.get()
+        if invocation is not None and invocation.wrote:
+            # read your own writes
+            return DEFAULT_DB_ALIAS
+        return random.choice(self.replicas)
+
+    def db_for_write(self, model, **hints):
+        invocation = current_invocation.get()
+        if invocation is not None:
+            invocation.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
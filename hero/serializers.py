@@ -0,0 +1,261 @@
+"""Serializers for hero's caches
+
+All serializers can store :class:`hero.models.Model` instances. A model
+instance is stored as its app label, model name and the values of its
+loaded fields and rehydrated without querying the database; related
+objects that had been loaded with it have to be loaded again.
+
+The serializer is chosen with the ``CACHE_SERIALIZER`` environment
+variable:
+
+- ``json`` (default): Readable by anything that reads the cache.
+- ``msgpack``: Smaller and faster than JSON and keeps integer dict keys.
+  Requires msgpack (``pip install discord-hero[msgpack]``).
+- ``pickle``: Keeps tuples, sets and most built-in types. Only the
+  built-in types and the classes listed in the ``CACHE_PICKLE_ALLOWED``
+  environment variable (comma-separated, e.g.
+  ``myext.models.Score,fractions.Fraction``) can be unpickled, so a
+  compromised cache server can't make the bot run arbitrary code.
+
+discord-hero: Discord Application Framework for humans
+
+:copyright: (c) 2019-2020 monospacedmagic et al.
+:license: Apache-2.0 OR MIT
+"""
+
+import datetime
+import decimal
+import io
+import json
+import os
+import pickle
+import uuid
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from aiocache.serializers import BaseSerializer
+from django.apps import apps
+from django.db.models import Model
+
+from .errors import ConfigurationError
+
+
+# tags of the types JSON and msgpack can't store natively,
+# also used as msgpack extension type codes
+_MODEL = 1
+_DATETIME = 2
+_DATE = 3
+_DECIMAL = 4
+_UUID = 5
+
+_JSON_TAG = '__hero_type__'
+
+
+def dump_model(instance: Model):
+    """Returns ``(app_label, model_name, field_names, values)`` for a
+    model instance. Deferred fields are left out.
+    """
+    opts = instance._meta
+    # read from __dict__ since foreign key attributes return coroutines in async code;
+    # deferred fields aren't in it
+    values = instance.__dict__
+    fields = [field for field in opts.concrete_fields if field.attname in values]
+    return (opts.app_label, opts.model_name, [field.attname for field in fields],
+            [_prep_value(field, values[field.attname]) for field in fields])
+
+
+def _prep_value(field, value):
+    return None if value is None else field.get_prep_value(value)
+
+
+def load_model(app_label, model_name, field_names, values):
+    """Rehydrates a model instance returned by :func:`dump_model`."""
+    model = apps.get_model(app_label, model_name)
+    fields = {field.attname: field for field in model._meta.concrete_fields}
+    values = [None if value is None else fields[name].to_python(value)
+              for name, value in zip(field_names, values)]
+    return model.from_db(None, field_names, values)
+
+
+def _encode(value):
+    """Returns the tag and a natively serializable payload for
+    values JSON and msgpack can't store.
+    """
+    if isinstance(value, Model):
+        return _MODEL, list(dump_model(value))
+    if isinstance(value, datetime.datetime):
+        return _DATETIME, value.isoformat()
+    if isinstance(value, datetime.date):
+        return _DATE, value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return _DECIMAL, str(value)
+    if isinstance(value, uuid.UUID):
+        return _UUID, value.hex
+    raise TypeError("Object of type {} can't be cached".format(type(value).__name__))
+
+
+def _decode(tag, payload):
+    if tag == _MODEL:
+        return load_model(*payload)
+    if tag == _DATETIME:
+        return datetime.datetime.fromisoformat(payload)
+    if tag == _DATE:
+        return datetime.date.fromisoformat(payload)
+    if tag == _DECIMAL:
+        return decimal.Decimal(payload)
+    if tag == _UUID:
+        return uuid.UUID(payload)
+    raise ValueError("Unknown type tag: {}".format(tag))
+
+
+class JsonSerializer(BaseSerializer):
+    """Like :class:`aiocache.serializers.JsonSerializer`, but also stores
+    model instances, datetimes, dates, decimals and UUIDs.
+    """
+
+    @staticmethod
+    def _default(value):
+        tag, payload = _encode(value)
+        return {_JSON_TAG: tag, 'value': payload}
+
+    @staticmethod
+    def _object_hook(obj):
+        if _JSON_TAG in obj:
+            return _decode(obj[_JSON_TAG], obj['value'])
+        return obj
+
+    def dumps(self, value):
+        return json.dumps(value, default=self._default, separators=(',', ':'))
+
+    def loads(self, value):
+        if value is None:
+            return None
+        return json.loads(value, object_hook=self._object_hook)
+
+
+class MsgPackSerializer(BaseSerializer):
+    """Stores values as msgpack. Model instances, datetimes, dates,
+    decimals and UUIDs are stored as extension types.
+    """
+
+    DEFAULT_ENCODING = None
+
+    def __init__(self, *args, **kwargs):
+        if msgpack is None:
+            raise ConfigurationError("CACHE_SERIALIZER=msgpack requires msgpack; "
+                                     "install it with `pip install discord-hero[msgpack]`")
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    def _default(cls, value):
+        tag, payload = _encode(value)
+        return msgpack.ExtType(tag, msgpack.packb(payload, default=cls._default, use_bin_type=True))
+
+    @classmethod
+    def _ext_hook(cls, code, data):
+        return _decode(code, msgpack.unpackb(data, ext_hook=cls._ext_hook, raw=False, strict_map_key=False))
+
+    def dumps(self, value):
+        return msgpack.packb(value, default=self._default, use_bin_type=True)
+
+    def loads(self, value):
+        if value is None:
+            return None
+        return msgpack.unpackb(value, ext_hook=self._ext_hook, raw=False, strict_map_key=False)
+
+
+SAFE_PICKLE_CLASSES = frozenset((
+    ('builtins', 'bool'),
+    ('builtins', 'bytearray'),
+    ('builtins', 'bytes'),
+    ('builtins', 'complex'),
+    ('builtins', 'dict'),
+    ('builtins', 'float'),
+    ('builtins', 'frozenset'),
+    ('builtins', 'int'),
+    ('builtins', 'list'),
+    ('builtins', 'range'),
+    ('builtins', 'set'),
+    ('builtins', 'slice'),
+    ('builtins', 'str'),
+    ('builtins', 'tuple'),
+    ('collections', 'OrderedDict'),
+    ('collections', 'deque'),
+    ('datetime', 'date'),
+    ('datetime', 'datetime'),
+    ('datetime', 'time'),
+    ('datetime', 'timedelta'),
+    ('datetime', 'timezone'),
+    ('decimal', 'Decimal'),
+    ('uuid', 'UUID'),
+))
+"""The ``(module, name)`` of the classes that can always be unpickled."""
+
+
+class _ModelPickler(pickle.Pickler):
+    def persistent_id(self, obj):
+        if isinstance(obj, Model):
+            return (_MODEL,) + dump_model(obj)
+        return None
+
+
+class RestrictedUnpickler(pickle.Unpickler):
+    """Only unpickles the classes in ``allowed``, plus model
+    instances stored by :class:`RestrictedPickleSerializer`.
+    """
+
+    def __init__(self, file, allowed, **kwargs):
+        super().__init__(file, **kwargs)
+        self.allowed = allowed
+
+    def find_class(self, module, name):
+        if (module, name) in self.allowed:
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError("{}.{} is not allowed to be unpickled from the cache; "
+                                     "add it to CACHE_PICKLE_ALLOWED".format(module, name))
+
+    def persistent_load(self, pid):
+        tag, *payload = pid
+        if tag != _MODEL:
+            raise pickle.UnpicklingError("Unknown persistent ID: {!r}".format(pid))
+        return load_model(*payload)
+
+
+class RestrictedPickleSerializer(BaseSerializer):
+    """Stores values as pickles, but only unpickles safe classes.
+
+    :param allowed:
+        The ``module.name`` of additional classes that can be unpickled.
+        Defaults to the value of the ``CACHE_PICKLE_ALLOWED`` environment
+        variable.
+    :type allowed: Optional[Iterable[str]]
+    """
+
+    DEFAULT_ENCODING = None
+
+    def __init__(self, *args, allowed=None, **kwargs):
+        if allowed is None:
+            allowed = [name for name in os.getenv('CACHE_PICKLE_ALLOWED', '').split(',') if name.strip()]
+        self.allowed = SAFE_PICKLE_CLASSES | {tuple(name.strip().rsplit('.', 1)) for name in allowed}
+        super().__init__(*args, **kwargs)
+
+    def dumps(self, value):
+        file = io.BytesIO()
+        _ModelPickler(file, protocol=pickle.HIGHEST_PROTOCOL).dump(value)
+        return file.getvalue()
+
+    def loads(self, value):
+        if value is None:
+            return None
+        return RestrictedUnpickler(io.BytesIO(value), self.allowed).load()
+
+
+SERIALIZERS = {
+    'json': 'hero.serializers.JsonSerializer',
+    'msgpack': 'hero.serializers.MsgPackSerializer',
+    'pickle': 'hero.serializers.RestrictedPickleSerializer',
+}
+"""The serializer classes by the values of ``CACHE_SERIALIZER``."""
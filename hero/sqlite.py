@@ -0,0 +1,94 @@
+"""High-throughput mode for SQLite
+
+If the ``USE_SQLITE_TUNING`` environment variable is set, every SQLite
+connection is configured to use write-ahead logging and to keep more of
+the database in memory. This allows reads to run in parallel to writes
+and makes writes a lot cheaper, at the cost of the last transactions
+possibly being lost (but never corrupted) on power failure.
+
+The following environment variables can be used to adjust the settings:
+
+``SQLITE_MMAP_SIZE``
+    The maximum number of bytes of the database file that are
+    memory-mapped. Defaults to 256 MiB.
+``SQLITE_CACHE_SIZE``
+    The size of the page cache of every connection in KiB.
+    Defaults to 64 MiB.
+``SQLITE_BUSY_TIMEOUT``
+    How many milliseconds to wait for a lock before raising a
+    "database is locked" error. Defaults to 5 seconds.
+``SQLITE_CHECKPOINT_INTERVAL``
+    How many seconds the :class:`hero.Core` waits between moving the
+    contents of the write-ahead log into the database. Defaults to
+    5 minutes.
+
+discord-hero: Discord Application Framework for humans
+
+:copyright: (c) 2019-2020 monospacedmagic et al.
+:license: Apache-2.0 OR MIT
+"""
+
+import asyncio
+import logging
+import os
+
+from django.db import connections
+
+from .utils import async_using_db
+
+
+logger = logging.getLogger('hero.db')
+
+
+def is_enabled(alias='default'):
+    return bool(os.getenv('USE_SQLITE_TUNING')) and connections[alias].vendor == 'sqlite'
+
+
+def get_pragmas():
+    """Returns the ``PRAGMA`` statements that are run
+    on every new connection in high-throughput mode.
+    """
+    return [
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))}",
+        # negative values are in KiB instead of pages
+        f"PRAGMA cache_size=-{int(os.getenv('SQLITE_CACHE_SIZE', 64 * 1024))}",
+        f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))}",
+        'PRAGMA temp_store=MEMORY',
+    ]
+
+
+def tune_connection(sender, connection, **kwargs):
+    """Receiver of Django's ``connection_created`` signal
+    that applies the pragmas to new SQLite connections.
+    """
+    if connection.vendor != 'sqlite' or not os.getenv('USE_SQLITE_TUNING'):
+        return
+    with connection.cursor() as cursor:
+        for pragma in get_pragmas():
+            cursor.execute(pragma)
+
+
+@async_using_db
+def checkpoint(alias='default'):
+    """Moves as much of the write-ahead log into the database
+    as possible without blocking readers or writers.
+    """
+    with connections[alias].cursor() as cursor:
+        cursor.execute('PRAGMA wal_checkpoint(PASSIVE)')
+        return cursor.fetchone()
+
+
+async def checkpoint_periodically(interval=None):
+    if interval is None:
+        interval = float(os.getenv('SQLITE_CHECKPOINT_INTERVAL', 300))
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            busy, log_pages, checkpointed_pages = await checkpoint()
+        except Exception:
+            logger.exception("WAL checkpoint failed")
+        else:
+            logger.debug("WAL checkpoint: %d of %d pages checkpointed%s", checkpointed_pages,
+                         log_pages, " (busy)" if busy else "")
@@ -0,0 +1,427 @@
+"""A two-tier cache backend for aiocache
+
+The :class:`TieredCache` keeps recently used values in a small in-process
+cache (L1) in front of Redis (L2). Every process that writes a key
+publishes its invalidation on a channel of the cache's namespace, so
+the other processes drop their local copy of the key.
+
+discord-hero: Discord Application Framework for humans
+
+:copyright: (c) 2019-2020 monospacedmagic et al.
+:license: Apache-2.0 OR MIT
+"""
+
+import asyncio
+from collections import defaultdict, OrderedDict
+import json
+import logging
+import os
+import time
+import uuid
+
+try:
+    import aioredis
+except ImportError:
+    aioredis = None
+
+from aiocache.base import BaseCache
+from aiocache.serializers import JsonSerializer, NullSerializer
+
+from .errors import ConfigurationError
+
+
+logger = logging.getLogger('hero.cache')
+
+CHANNEL_PREFIX = 'hero_cache_invalidation:'
+"""str: The prefix of the names of the invalidation channels."""
+
+
+class InvalidationBroker:
+    """Delivers invalidation messages to the :class:`TieredCache`
+    instances subscribed to a channel, including those
+    of other processes.
+    """
+
+    async def publish(self, channel, message: str):
+        raise NotImplementedError
+
+    async def subscribe(self, channel, callback):
+        """Calls ``callback(message)`` for every message published
+        on ``channel`` from now on. ``callback(None)`` is called if
+        messages may have been lost, e.g. because the connection to
+        the broker has been interrupted.
+        """
+        raise NotImplementedError
+
+    async def unsubscribe(self, channel, callback):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class LocalBroker(InvalidationBroker):
+    """Delivers invalidation messages within the current process.
+
+    Useful for tests and bots that run in a single process.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(list)
+
+    async def publish(self, channel, message: str):
+        for callback in list(self._subscribers.get(channel, ())):
+            callback(message)
+
+    async def subscribe(self, channel, callback):
+        self._subscribers[channel].append(callback)
+
+    async def unsubscribe(self, channel, callback):
+        try:
+            self._subscribers[channel].remove(callback)
+        except ValueError:
+            pass
+
+
+local_broker = LocalBroker()
+"""The :class:`LocalBroker` used if ``CACHE_BROKER`` is ``local``."""
+
+# (endpoint, port, db) -> RedisBroker shared by the caches of all namespaces
+_redis_brokers = {}
+
+
+class RedisBroker(InvalidationBroker):
+    """Delivers invalidation messages through Redis pub/sub.
+
+    Requires aioredis (``pip install discord-hero[redis]``).
+
+    :param create_connection:
+        The coroutine function that opens a connection to Redis;
+        ``aioredis.create_redis`` by default. Tests can pass
+        ``fakeredis.aioredis.create_redis_pool`` instead.
+    :type create_connection: Optional[Callable]
+    :param retry_after:
+        How many seconds to wait before resubscribing
+        after the connection has been lost.
+    :type retry_after: float
+    """
+
+    def __init__(self, endpoint='127.0.0.1', port=6379, password=None, db=0,
+                 create_connection=None, retry_after=1.0):
+        if create_connection is None:
+            if aioredis is None:
+                raise ConfigurationError("The tiered cache requires aioredis; "
+                                         "install it with `pip install discord-hero[redis]`")
+            create_connection = aioredis.create_redis
+        self.address = (endpoint, int(port))
+        self.password = password
+        self.db = int(db or 0)
+        self.create_connection = create_connection
+        self.retry_after = retry_after
+        self._publisher = None
+        self._lock = None
+        # (channel, callback) -> task reading the channel
+        self._readers = {}
+
+    async def _connect(self):
+        return await self.create_connection(self.address, password=self.password, db=self.db)
+
+    async def publish(self, channel, message: str):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._publisher is None or self._publisher.closed:
+                self._publisher = await self._connect()
+        await self._publisher.publish(channel, message)
+
+    async def subscribe(self, channel, callback):
+        ready = asyncio.get_event_loop().create_future()
+        self._readers[(channel, callback)] = asyncio.ensure_future(self._read(channel, callback, ready))
+        await ready
+
+    async def _read(self, channel, callback, ready):
+        while True:
+            # a subscribed connection can't be used for anything else
+            connection = None
+            try:
+                connection = await self._connect()
+                (receiver,) = await connection.subscribe(channel)
+                if not ready.done():
+                    ready.set_result(None)
+                while await receiver.wait_message():
+                    callback(await receiver.get(encoding='utf-8'))
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                if not ready.done():
+                    ready.set_exception(error)
+                    return
+                logger.warning("Lost the subscription to %s: %r", channel, error)
+            finally:
+                if connection is not None:
+                    connection.close()
+            # messages published in the meantime are lost
+            callback(None)
+            await asyncio.sleep(self.retry_after)
+
+    async def unsubscribe(self, channel, callback):
+        reader = self._readers.pop((channel, callback), None)
+        if reader is not None:
+            reader.cancel()
+            await asyncio.gather(reader, return_exceptions=True)
+
+    async def close(self):
+        for channel, callback in list(self._readers):
+            await self.unsubscribe(channel, callback)
+        if self._publisher is not None:
+            self._publisher.close()
+            await self._publisher.wait_closed()
+            self._publisher = None
+
+
+class TieredCache(BaseCache):
+    """A cache that keeps up to ``l1_size`` deserialized values in
+    process memory and all values in Redis.
+
+    Reading a key found in the process memory neither talks to Redis
+    nor decodes the value; note that this returns the same object to
+    all callers, so cached values must not be modified. Values are kept
+    in process memory for at most ``l1_ttl`` seconds, which limits for
+    how long another process may see an outdated value if an
+    invalidation message gets lost.
+
+    Keys are stored in Redis like :class:`aiocache.RedisCache` stores
+    them, so switching between ``CACHE_TYPE=redis`` and
+    ``CACHE_TYPE=tiered`` keeps the cached values.
+
+    :param l1_size:
+        Defaults to the value of the ``CACHE_L1_SIZE``
+        environment variable or ``1024``.
+    :type l1_size: Optional[int]
+    :param l1_ttl:
+        Defaults to the value of the ``CACHE_L1_TTL``
+        environment variable or ``30``.
+    :type l1_ttl: Optional[float]
+    :param broker:
+        Defaults to a :class:`RedisBroker` connected to the same Redis
+        server, or :data:`local_broker` if the ``CACHE_BROKER``
+        environment variable is ``local``.
+    :type broker: Optional[InvalidationBroker]
+    :param l2:
+        The cache behind the process memory;
+        an :class:`aiocache.RedisCache` by default.
+    :type l2: Optional[aiocache.base.BaseCache]
+    """
+
+    NAME = 'tiered'
+
+    def __init__(self, serializer=None, l1_size=None, l1_ttl=None, broker=None, l2=None,
+                 endpoint='127.0.0.1', port=6379, password=None, db=0,
+                 pool_min_size=1, pool_max_size=10, **kwargs):
+        # values are (de)serialized by the L2 cache, the L1 cache keeps them as they are
+        super().__init__(serializer=NullSerializer(), **kwargs)
+        endpoint = endpoint or '127.0.0.1'
+        port = int(port or 6379)
+        db = int(db or 0)
+        if l1_size is None:
+            l1_size = int(os.getenv('CACHE_L1_SIZE', 1024))
+        if l1_ttl is None:
+            l1_ttl = float(os.getenv('CACHE_L1_TTL', 30))
+        self.l1_size = l1_size
+        self.l1_ttl = l1_ttl
+        if l2 is None:
+            try:
+                from aiocache import RedisCache
+            except ImportError:
+                raise ConfigurationError("The tiered cache requires aioredis; "
+                                         "install it with `pip install discord-hero[redis]`")
+            l2 = RedisCache(serializer=serializer or JsonSerializer(), endpoint=endpoint, port=port,
+                            password=password, db=db, pool_min_size=pool_min_size,
+                            pool_max_size=pool_max_size, timeout=self.timeout)
+        self.l2 = l2
+        if broker is None:
+            if os.getenv('CACHE_BROKER', 'redis') == 'local':
+                broker = local_broker
+            else:
+                broker_key = (endpoint, port, db)
+                broker = _redis_brokers.get(broker_key)
+                if broker is None:
+                    broker = _redis_brokers[broker_key] = RedisBroker(endpoint=endpoint, port=port,
+                                                                      password=password, db=db)
+        self.broker = broker
+        self.channel = CHANNEL_PREFIX + (self.namespace or '')
+        # identifies this cache's own messages
+        self._id = uuid.uuid4().hex
+        # key -> (value, expiry time)
+        self._l1 = OrderedDict()
+        # changes whenever keys are invalidated, so values read from the
+        # L2 cache before an invalidation aren't stored in the L1 cache
+        self._generation = 0
+        self._subscribed = None
+
+    def _build_key(self, key, namespace=None):
+        if namespace is not None:
+            return "{}{}{}".format(namespace, ":" if namespace else "", key)
+        if self.namespace is not None:
+            return "{}{}{}".format(self.namespace, ":" if self.namespace else "", key)
+        return key
+
+    def __repr__(self):  # pragma: no cover
+        return "TieredCache ({} in memory, {!r})".format(len(self._l1), self.l2)
+
+    # L1 cache
+
+    def _l1_get(self, key):
+        try:
+            value, expires_at = self._l1[key]
+        except KeyError:
+            return None
+        if expires_at < time.monotonic():
+            del self._l1[key]
+            return None
+        self._l1.move_to_end(key)
+        return value
+
+    def _l1_set(self, key, value, ttl=None):
+        if not self.l1_size or not self.l1_ttl or value is None:
+            return
+        ttl = self.l1_ttl if not ttl else min(ttl, self.l1_ttl)
+        self._l1[key] = (value, time.monotonic() + ttl)
+        self._l1.move_to_end(key)
+        while len(self._l1) > self.l1_size:
+            self._l1.popitem(last=False)
+
+    def _l1_discard(self, keys=None, namespace=None):
+        self._generation += 1
+        if keys is not None:
+            for key in keys:
+                self._l1.pop(key, None)
+        elif namespace:
+            prefix = namespace + ':'
+            for key in [key for key in self._l1 if key.startswith(prefix)]:
+                del self._l1[key]
+        else:
+            self._l1.clear()
+
+    # invalidation
+
+    def _on_message(self, message):
+        if message is None:
+            self._l1_discard()
+            return
+        try:
+            data = json.loads(message)
+        except ValueError:
+            logger.warning("Invalid message on %s: %r", self.channel, message)
+            return
+        if data.get('sender') == self._id:
+            return
+        if 'keys' in data:
+            self._l1_discard(keys=data['keys'])
+        else:
+            self._l1_discard(namespace=data.get('namespace'))
+
+    async def _subscribe(self):
+        if self._subscribed is None:
+            self._subscribed = asyncio.ensure_future(self.broker.subscribe(self.channel, self._on_message))
+        try:
+            await asyncio.shield(self._subscribed)
+        except Exception:
+            self._subscribed = None
+            raise
+
+    async def _invalidate(self, keys=None, namespace=None):
+        self._l1_discard(keys=keys, namespace=namespace)
+        if keys is not None:
+            message = {'sender': self._id, 'keys': list(keys)}
+        else:
+            message = {'sender': self._id, 'namespace': namespace}
+        await self.broker.publish(self.channel, json.dumps(message))
+
+    # aiocache backend
+
+    async def _get(self, key, encoding='utf-8', _conn=None):
+        value = self._l1_get(key)
+        if value is not None:
+            return value
+        await self._subscribe()
+        generation = self._generation
+        value = await self.l2.get(key, namespace='')
+        if generation == self._generation:
+            self._l1_set(key, value)
+        return value
+
+    async def _gets(self, key, encoding='utf-8', _conn=None):
+        return await self._get(key, encoding=encoding, _conn=_conn)
+
+    async def _multi_get(self, keys, encoding='utf-8', _conn=None):
+        values = [self._l1_get(key) for key in keys]
+        missing = [key for key, value in zip(keys, values) if value is None]
+        if not missing:
+            return values
+        await self._subscribe()
+        generation = self._generation
+        loaded = dict(zip(missing, await self.l2.multi_get(missing, namespace='')))
+        if generation == self._generation:
+            for key, value in loaded.items():
+                self._l1_set(key, value)
+        return [loaded[key] if value is None else value for key, value in zip(keys, values)]
+
+    async def _set(self, key, value, ttl=None, _cas_token=None, _conn=None):
+        result = await self.l2.set(key, value, ttl=ttl, namespace='', _cas_token=_cas_token)
+        await self._invalidate(keys=[key])
+        if result:
+            self._l1_set(key, value, ttl)
+        return result
+
+    async def _multi_set(self, pairs, ttl=None, _conn=None):
+        result = await self.l2.multi_set(pairs, ttl=ttl, namespace='')
+        await self._invalidate(keys=[key for key, _ in pairs])
+        for key, value in pairs:
+            self._l1_set(key, value, ttl)
+        return result
+
+    async def _add(self, key, value, ttl=None, _conn=None):
+        result = await self.l2.add(key, value, ttl=ttl, namespace='')
+        await self._invalidate(keys=[key])
+        self._l1_set(key, value, ttl)
+        return result
+
+    async def _exists(self, key, _conn=None):
+        if self._l1_get(key) is not None:
+            return True
+        return await self.l2.exists(key, namespace='')
+
+    async def _increment(self, key, delta, _conn=None):
+        try:
+            return await self.l2.increment(key, delta, namespace='')
+        finally:
+            await self._invalidate(keys=[key])
+
+    async def _expire(self, key, ttl, _conn=None):
+        result = await self.l2.expire(key, ttl, namespace='')
+        await self._invalidate(keys=[key])
+        return result
+
+    async def _delete(self, key, _conn=None):
+        result = await self.l2.delete(key, namespace='')
+        await self._invalidate(keys=[key])
+        return result
+
+    async def _clear(self, namespace=None, _conn=None):
+        result = await self.l2.clear(namespace=namespace)
+        await self._invalidate(namespace=namespace)
+        return result
+
+    async def _raw(self, command, *args, encoding='utf-8', _conn=None, **kwargs):
+        # raw commands bypass the L1 cache and aren't propagated
+        return await self.l2.raw(command, *args, encoding=encoding, **kwargs)
+
+    async def _redlock_release(self, key, value):
+        return await self.l2._redlock_release(key, value)
+
+    async def _close(self, *args, _conn=None, **kwargs):
+        if self._subscribed is not None:
+            self._subscribed = None
+            await self.broker.unsubscribe(self.channel, self._on_message)
+        await self.l2.close()
@@ -7,9 +7,12 @@ discord-hero: Discord Application Framework for humans
 """
 
 import asyncio
+import contextvars
 import copy
 import functools
+import logging
 import re
+import time
 
 import aiohttp
 
@@ -19,6 +22,13 @@ from discord import Object
 from discord.utils import maybe_coroutine
 from discord.errors import HTTPException, GatewayNotFound, ConnectionClosed
 
+from django.db import transaction
+
+from . import metrics
+
+
+db_logger = logging.getLogger('hero.db')
+
 
 def issubmodule(parent, child):
     return parent == child or child.startswith(parent + ".")
@@ -140,7 +150,42 @@ sync_to_async_threadsafe = SyncToAsyncThreadSafe
 async_to_sync = AsyncToSync
 
 
-class AsyncUsingDB(SyncToAsyncThreadSafe):
+def _get_model(obj):
+    # the model an object decorated with async_using_db was called on, if any
+    if hasattr(obj, '_meta'):
+        return obj if isinstance(obj, type) else type(obj)
+    model = getattr(obj, 'model', None)
+    if isinstance(model, type) and hasattr(model, '_meta'):
+        return model
+    return None
+
+
+class AsyncUsingDB(SyncToAsync):
+    def __init__(self, func, readonly=False):
+        super().__init__(func, thread_sensitive=False)
+        self._readonly = readonly
+
+    @classmethod
+    def readonly(cls, func):
+        """Like :func:`async_using_db`, but marks the decorated function
+        as only reading from the database, which allows it to run in
+        parallel to writes.
+        """
+        return cls(func, readonly=True)
+
+    async def __call__(self, *args, **kwargs):
+        from .executor import get_executor
+        from .routers import reading
+
+        context = contextvars.copy_context()
+        if self._readonly:
+            # lets the router send the queries to a read replica
+            context.run(reading.set, True)
+        func = functools.partial(context.run, self.func, *args, **kwargs)
+        model = _get_model(args[0]) if args else None
+        return await get_executor().run(func, readonly=self._readonly,
+                                        name=getattr(self.func, '__qualname__', None), model=model)
+
     @property
     def sync(self):
         return self.func
@@ -153,10 +198,55 @@ exception would be raised by Django. Do NOT decorate an async function with this
 as that would be not only redundant but would also stop this decorator from
 working as intended.
 
+Decorated functions are run by a pool of database worker threads (see
+:class:`hero.executor.DatabaseExecutor`). Use ``@async_using_db.readonly``
+for functions that only read from the database; their queries may be
+run on a read replica (see :mod:`hero.routers`).
+
 To use functions decorated with this synchronously, call ``decorated_function.sync``.
 """
 
 
+@async_using_db
+def _run_atomic(func, *args, **kwargs):
+    name = getattr(func, '__qualname__', repr(func))
+    start = time.perf_counter()
+    try:
+        with transaction.atomic():
+            return func(*args, **kwargs)
+    finally:
+        held_for = time.perf_counter() - start
+        metrics.get_histogram(f'db.atomic.{name}').observe(held_for)
+        db_logger.debug("%s held the database connection for %.2f ms", name, held_for * 1000)
+
+
+async def run_in_db(func, *args, **kwargs):
+    """Runs the synchronous function ``func(*args, **kwargs)`` on a database
+    worker inside a transaction and returns its result.
+
+    This allows running several queries with only one thread handoff
+    and with the guarantee that either all or none of the changes
+    made by ``func`` are saved. If ``func`` raises an exception,
+    the transaction is rolled back and the exception is propagated.
+
+    How long ``func`` held the database connection is recorded in the
+    ``db.atomic.<qualified name of func>`` histogram (see :mod:`hero.metrics`).
+
+    Example: ::
+
+        def transfer(sender_id, receiver_id, amount):
+            sender = Account.objects.select_for_update().get(id=sender_id)
+            receiver = Account.objects.select_for_update().get(id=receiver_id)
+            sender.balance -= amount
+            receiver.balance += amount
+            sender.save()
+            receiver.save()
+
+        await hero.run_in_db(transfer, ctx.author.id, user.id, 100)
+    """
+    return await _run_atomic(func, *args, **kwargs)
+
+
 def merge_configs(default, overwrite):
     """From `cookiecutter <https://github.com/audreyr/cookiecutter>`__"""
     new_config = copy.deepcopy(default)
@@ -38,7 +38,10 @@ setup_requirements = []
 
 extra_requirements = {
     'redis': ['aioredis>=1.0.0'],
-    'postgresql': ['psycopg2']
+    'postgresql': ['psycopg2'],
+    'native': ['aiosqlite', 'asyncpg'],
+    'numpy': ['numpy'],
+    'msgpack': ['msgpack']
 }
 
 with codecs.open(os.path.join(here, 'hero', '__init__.py'), encoding='utf-8') as f:
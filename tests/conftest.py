@@ -0,0 +1,30 @@
+import os
+import tempfile
+
+import pytest
+
+
+# the database is created in the working directory
+os.chdir(tempfile.mkdtemp(prefix='hero-tests-'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hero.django_settings')
+os.environ.setdefault('CACHE_TYPE', 'simple')
+os.environ.setdefault('NAMESPACE', 'default')
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.core import management  # noqa: E402
+
+import hero  # noqa: E402
+
+hero.cache.init()
+django.setup(set_prefix=False)
+# the tables are created from the models since hero doesn't ship migrations
+settings.MIGRATION_MODULES = {'hero': None}
+management.call_command('migrate', run_syncdb=True, interactive=False, verbosity=0)
+
+
+@pytest.fixture(scope='session', autouse=True)
+def executor():
+    yield
+    from hero.executor import shutdown_executor
+    shutdown_executor()
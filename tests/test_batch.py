@@ -0,0 +1,30 @@
+import asyncio
+
+from hero import models
+from hero.db import Database
+
+
+def test_save_after_create_in_batch():
+    async def run():
+        db = Database(None)
+        async with db.batch():
+            emoji = await models.Emoji.async_create(name='x', is_custom=False)
+            emoji.name = 'y'
+            await emoji.async_save()
+        return emoji, await models.Emoji.objects.filter(name__in=('x', 'y')).async_count()
+
+    emoji, count = asyncio.run(run())
+    assert count == 1
+    assert emoji.pk is not None
+    assert models.Emoji.objects.get(pk=emoji.pk).name == 'y'
+
+
+def test_delete_after_create_in_batch():
+    async def run():
+        db = Database(None)
+        async with db.batch():
+            emoji = await models.Emoji.async_create(name='z', is_custom=False)
+            await emoji.async_delete()
+        return await models.Emoji.objects.filter(name='z').async_count()
+
+    assert asyncio.run(run()) == 0
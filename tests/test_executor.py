@@ -0,0 +1,32 @@
+import asyncio
+
+from hero import models
+from hero.executor import DatabaseExecutor
+
+
+def test_dedicated_workers_are_bounded():
+    async def run():
+        executor = DatabaseExecutor(max_workers=1, max_streams=1)
+        first = await executor.start_dedicated()
+        second = asyncio.ensure_future(executor.start_dedicated())
+        await asyncio.sleep(0.05)
+        waited = not second.done()
+        first.close()
+        (await asyncio.wait_for(second, 1)).close()
+        executor.shutdown()
+        return waited
+
+    assert asyncio.run(run())
+
+
+def test_concurrent_streams():
+    models.Guild.objects.bulk_create([models.Guild(id=i) for i in range(5000, 5100)])
+
+    async def stream():
+        return [guild.id async for guild in models.Guild.objects.filter(id__gte=5000).order_by('id').astream(10)]
+
+    async def run():
+        return await asyncio.gather(*(stream() for _ in range(8)))
+
+    for ids in asyncio.run(run()):
+        assert ids == list(range(5000, 5100))
@@ -0,0 +1,45 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from hero.native import SQLiteEngine
+
+
+def test_failed_connect_frees_its_slot():
+    engine = SQLiteEngine('default')
+    engine.pool_size = 1
+    connect = engine._connect
+    attempts = []
+
+    def failing_connect(*args, **kwargs):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise sqlite3.OperationalError("unable to open database file")
+        return connect(*args, **kwargs)
+
+    engine._connect = failing_connect
+
+    async def run():
+        with pytest.raises(sqlite3.OperationalError):
+            await engine.fetch('SELECT 1', ())
+        rows = await asyncio.wait_for(engine.fetch('SELECT 1', ()), 1)
+        await engine.close()
+        return rows
+
+    assert asyncio.run(run()) == [(1,)]
+
+
+def test_broken_connection_is_replaced():
+    engine = SQLiteEngine('default')
+    engine.pool_size = 1
+
+    async def run():
+        with pytest.raises(sqlite3.OperationalError):
+            await engine.fetch('SELECT * FROM no_such_table', ())
+        rows = await asyncio.wait_for(engine.fetch('SELECT 1', ()), 1)
+        opened = engine._opened
+        await engine.close()
+        return rows, opened
+
+    assert asyncio.run(run()) == ([(1,)], 1)
@@ -0,0 +1,23 @@
+import asyncio
+
+from hero import models
+from hero.registration import Registration, user_registry
+from hero.utils import async_using_db
+
+
+def test_user_registered_by_another_process():
+    async def run():
+        await async_using_db(user_registry.load)()
+        # bulk inserts don't send post_save, like a save in another process
+        await async_using_db(models.User.objects.bulk_create)([models.User(id=4242)])
+        assert user_registry.get(4242) is None
+        return await models.User.async_lookup(4242)
+
+    user = asyncio.run(run())
+    assert isinstance(user, models.User)
+    assert user_registry.get(4242) is Registration.ACTIVE
+
+
+def test_unknown_user_is_unregistered():
+    asyncio.run(async_using_db(user_registry.load)())
+    assert models.User.lookup(4343) is Registration.UNREGISTERED
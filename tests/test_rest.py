@@ -0,0 +1,36 @@
+import asyncio
+import traceback
+
+import discord
+
+from hero.rest import RestFetcher
+
+
+class FakeResponse:
+    status = 404
+    reason = 'Not Found'
+
+
+def test_remembered_error_traceback_does_not_grow():
+    fetcher = RestFetcher(negative_ttl=60)
+    requests = []
+
+    async def fetch_user(user_id):
+        requests.append(user_id)
+        raise discord.NotFound(FakeResponse(), 'Unknown User')
+
+    async def fetch():
+        try:
+            await fetcher.fetch(('user', 1), fetch_user, 1)
+        except discord.NotFound as error:
+            return len(traceback.extract_tb(error.__traceback__))
+
+    async def run():
+        return [await fetch() for _ in range(5)]
+
+    depths = asyncio.run(run())
+    assert requests == [1]
+    assert len(set(depths[1:])) == 1
+    fetcher.forget(('user', 1))
+    asyncio.run(fetch())
+    assert requests == [1, 1]
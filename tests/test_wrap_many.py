@@ -0,0 +1,29 @@
+import asyncio
+import types
+
+import discord
+
+from hero import models
+from hero.db import Database
+from hero.identity import IdentityMap
+from hero.registration import user_registry
+from hero.utils import async_using_db
+
+BOT_ID = 990
+
+
+def make_user(user_id):
+    state = types.SimpleNamespace(user=types.SimpleNamespace(id=BOT_ID))
+    return discord.User(state=state, data={'id': str(user_id), 'username': 'bot', 'discriminator': '0001',
+                                           'avatar': None, 'bot': user_id == BOT_ID})
+
+
+def test_wrap_many_bot_user_unknown_to_registry():
+    async def run():
+        await async_using_db(user_registry.load)()
+        db = Database(types.SimpleNamespace(identity_map=IdentityMap()))
+        return await db.wrap_many([make_user(BOT_ID)])
+
+    (user,) = asyncio.run(run())
+    assert user.id == BOT_ID
+    assert models.User.objects.filter(id=BOT_ID).exists()